@@ -0,0 +1,5 @@
+from util.config import Config, set_config
+
+
+# Benchmarks never read config.yml; the fakes supply everything the bot needs
+set_config(Config(data={'bot': {}}, debug=False, debug_guilds=(), mtime=0.0))
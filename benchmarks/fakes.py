@@ -0,0 +1,340 @@
+"""
+In-process stand-ins for the services the bot talks to:
+a fake REST backend, a fake Spotify Web API, and stub nextcord objects.
+"""
+from aiohttp import web
+from asyncio import sleep
+from datetime import datetime, timezone
+from itertools import count
+from time import time
+from typing import Any, Dict, List, Optional, Set
+
+
+class FakeServer:
+    """
+    Base for fake HTTP services, served on a random local port with optional per-request latency
+    """
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        self.app = web.Application(middlewares=[self._middleware])
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ''
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler) -> web.StreamResponse:
+        self.requests += 1
+        if self.latency > 0:
+            await sleep(self.latency)
+        return await handler(request)
+
+    async def start(self) -> str:
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f'http://127.0.0.1:{port}'
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+class FakeBackend(FakeServer):
+    """
+    In-memory implementation of the REST backend contract used by util/api.py
+    """
+    def __init__(self, prefix: str = '/api', latency: float = 0.0):
+        super().__init__(latency)
+        self.prefix = prefix
+        self.guilds: Dict[int, Dict[str, Any]] = {}
+        self.users: Dict[int, Dict[str, Any]] = {}
+        self.notes: Dict[tuple, List[Dict[str, Any]]] = {}
+        self.excluded_threads: Dict[int, Set[int]] = {}
+        self.spotify_auth: Dict[int, Dict[str, Any]] = {}
+        self._note_ids = count()
+
+        self.app.router.add_route('*', f'{prefix}/guilds', self.handle_guilds)
+        self.app.router.add_route('*', f'{prefix}/users', self.handle_users)
+        self.app.router.add_route('*', f'{prefix}/notes', self.handle_notes)
+        self.app.router.add_route('*', f'{prefix}/excluded_threads', self.handle_excluded_threads)
+        self.app.router.add_get(f'{prefix}/excluded_threads/guilds', self.handle_managed_guilds)
+        self.app.router.add_route('*', f'{prefix}/spotify_auth', self.handle_spotify_auth)
+
+    def add_notes(self, for_guild: bool, owner: int, count_: int, note_type: str = 'text'):
+        """
+        Seed notes for an owner
+        """
+        for i in range(count_):
+            self._insert_note(for_guild, owner, {
+                'sender': owner,
+                'type': note_type,
+                'title': f'Note {i}',
+                'url': f'https://open.spotify.com/track/{i:022d}' if note_type == 'spotify:track' else ''
+            })
+
+    def _insert_note(self, for_guild: bool, owner: int, note: Dict[str, Any]):
+        self.notes.setdefault((for_guild, owner), []).append({
+            'id': str(next(self._note_ids)),
+            'timestamp': time(),
+            'sender': note['sender'],
+            'recipient': owner,
+            'type': note['type'],
+            'title': note['title'],
+            'url': note['url']
+        })
+
+    async def handle_guilds(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        guild_id = data['id']
+        if request.method == 'GET':
+            if guild_id not in self.guilds:
+                return web.json_response({'error': 'Guild not found'}, status=404)
+            return web.json_response({'guild': self.guilds[guild_id]})
+        if request.method == 'POST':
+            self.guilds[guild_id] = {'id': guild_id, 'name': data['name'], 'manage_threads': data['manage_threads']}
+        elif request.method == 'PUT':
+            if guild_id not in self.guilds:
+                return web.json_response({'error': 'Guild not found'}, status=404)
+            self.guilds[guild_id].update({k: v for k, v in data.items() if v is not None})
+        elif request.method == 'DELETE':
+            self.guilds.pop(guild_id, None)
+        return web.json_response({})
+
+    async def handle_users(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        if request.method == 'PUT':
+            self.users[data['id']] = data
+        elif request.method == 'DELETE':
+            self.users.pop(data['id'], None)
+        return web.json_response({})
+
+    async def handle_notes(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        if request.method == 'POST':
+            key = (data['for_guild'], data['recipient'])
+            for note in data.get('notes', [data]):
+                self._insert_note(*key, note)
+            return web.json_response({})
+
+        key = (data['for_guild'], data['owner'])
+        notes = self.notes.get(key, [])
+        if request.method == 'DELETE':
+            if data.get('delete_all'):
+                self.notes.pop(key, None)
+            else:
+                ids = set(data.get('ids', [data.get('id')]))
+                self.notes[key] = [note for note in notes if note['id'] not in ids]
+            return web.json_response({})
+
+        # GET, with optional filters and paging
+        if 'type' in data:
+            notes = [note for note in notes if note['type'] == data['type']]
+        if 'sender' in data:
+            notes = [note for note in notes if note['sender'] == data['sender']]
+        if 'offset' not in data:
+            return web.json_response(notes)
+        offset, limit = data['offset'], data['limit']
+        return web.json_response({'notes': notes[offset:offset + limit], 'total': len(notes)})
+
+    async def handle_excluded_threads(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        excluded = self.excluded_threads.setdefault(data['guild_id'], set())
+        if request.method == 'POST':
+            excluded.add(data['thread_id'])
+        elif request.method == 'DELETE':
+            excluded.discard(data['thread_id'])
+        else:
+            return web.json_response({'excluded_threads': list(excluded)})
+        return web.json_response({})
+
+    async def handle_managed_guilds(self, _: web.Request) -> web.Response:
+        return web.json_response({
+            'guilds': [guild_id for guild_id, guild in self.guilds.items() if guild['manage_threads']]
+        })
+
+
+    async def handle_spotify_auth(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        user_id = data.pop('user_id')
+        if request.method == 'PUT':
+            self.spotify_auth[user_id] = data
+            return web.json_response({})
+        if user_id not in self.spotify_auth:
+            return web.json_response({'error': 'Not logged in'}, status=404)
+        return web.json_response({'credentials': self.spotify_auth[user_id]})
+
+
+class FakeSpotifyAPI(FakeServer):
+    """
+    Fake Spotify Web API covering catalog lookups and playlist creation.
+    Like Spotify, rejects tracks inserted past the end of a playlist.
+    """
+    def __init__(self, latency: float = 0.0):
+        super().__init__(latency)
+        self.playlists: Dict[str, Dict[str, Any]] = {}
+        self._playlist_ids = count()
+
+        self.app.router.add_get('/v1/me', self.handle_me)
+        self.app.router.add_get('/v1/{entity_type:tracks|albums|artists}', self.handle_entities)
+        self.app.router.add_get('/v1/{entity_type:tracks|albums|artists}/', self.handle_entities)
+        self.app.router.add_get('/v1/{entity_type:tracks|albums|artists}/{entity_id}', self.handle_entity)
+        self.app.router.add_post('/v1/users/{user_id}/playlists', self.handle_create_playlist)
+        self.app.router.add_get('/v1/playlists/{playlist_id}', self.handle_get_playlist)
+        self.app.router.add_post('/v1/playlists/{playlist_id}/tracks', self.handle_add_tracks)
+
+    @staticmethod
+    def entity(entity_type: str, entity_id: str) -> Dict[str, Any]:
+        data = {'id': entity_id, 'name': f'{entity_type} {entity_id}', 'images': []}
+        if entity_type != 'artists':
+            data['artists'] = [{'id': 'artist', 'name': 'Artist'}]
+        if entity_type == 'tracks':
+            data['duration_ms'] = 180000
+        return data
+
+    async def handle_me(self, _: web.Request) -> web.Response:
+        return web.json_response({'id': 'benchmark'})
+
+    async def handle_entities(self, request: web.Request) -> web.Response:
+        entity_type = request.match_info['entity_type']
+        ids = request.query['ids'].split(',')
+        return web.json_response({entity_type: [self.entity(entity_type, entity_id) for entity_id in ids]})
+
+    async def handle_entity(self, request: web.Request) -> web.Response:
+        return web.json_response(self.entity(request.match_info['entity_type'], request.match_info['entity_id']))
+
+    async def handle_create_playlist(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        playlist_id = f'playlist{next(self._playlist_ids)}'
+        self.playlists[playlist_id] = {'id': playlist_id, 'name': data['name'], 'tracks': []}
+        return web.json_response({'id': playlist_id, 'name': data['name']}, status=201)
+
+    async def handle_get_playlist(self, request: web.Request) -> web.Response:
+        playlist = self.playlists[request.match_info['playlist_id']]
+        return web.json_response({'name': playlist['name'], 'owner': {'display_name': 'benchmark'}})
+
+    async def handle_add_tracks(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        tracks = self.playlists[request.match_info['playlist_id']]['tracks']
+        position = data.get('position', len(tracks))
+        if position > len(tracks):
+            return web.json_response({'error': {'status': 400, 'message': 'Index out of bounds'}}, status=400)
+        tracks[position:position] = data['uris']
+        return web.json_response({'snapshot_id': str(len(tracks))}, status=201)
+
+
+class StubUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.name = f'user{user_id}'
+        self.discriminator = '0001'
+        self.mention = f'<@{user_id}>'
+        self.avatar = None
+
+
+class StubGuild:
+    def __init__(self, guild_id: int, threads: Optional[List['StubThread']] = None,
+                 members: Optional[List[StubUser]] = None):
+        self.id = guild_id
+        self.name = f'guild{guild_id}'
+        self.icon = None
+        self.threads = threads if threads is not None else []
+        self.members = members if members is not None else []
+
+
+class StubThread:
+    """
+    Thread whose edits take `edit_latency` seconds, like a round trip to Discord
+    """
+    def __init__(self, thread_id: int, guild: StubGuild, archived: bool, edit_latency: float = 0.0):
+        self.id = thread_id
+        self.guild = guild
+        self.archived = archived
+        self.archive_timestamp = datetime.now(timezone.utc)
+        self.last_message_id = None
+        self.auto_archive_duration = 1440
+        self.edit_latency = edit_latency
+
+    async def edit(self, archived: bool = False, **_) -> 'StubThread':
+        if self.edit_latency > 0:
+            await sleep(self.edit_latency)
+        self.archived = archived
+        self.archive_timestamp = datetime.now(timezone.utc)
+        return self
+
+
+class StubMessage:
+    _ids = count(1)
+
+    def __init__(self, channel: 'StubChannel', embed: Any = None, view: Any = None):
+        self.id = next(self._ids)
+        self.channel = channel
+        self.embed = embed
+        self.view = view
+
+    async def edit(self, embed: Any = None, view: Any = None, **_) -> 'StubMessage':
+        if embed is not None:
+            self.embed = embed
+        self.view = view
+        return self
+
+
+class StubChannel:
+    def __init__(self):
+        self.messages: Dict[int, StubMessage] = {}
+
+    async def fetch_message(self, message_id: int) -> StubMessage:
+        return self.messages[message_id]
+
+    async def send(self, embed: Any = None, **_) -> StubMessage:
+        return await self._send(embed=embed)
+
+    async def _send(self, embed: Any = None, view: Any = None) -> StubMessage:
+        message = StubMessage(self, embed=embed, view=view)
+        self.messages[message.id] = message
+        return message
+
+
+class StubResponse:
+    def __init__(self):
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def defer(self, **_):
+        self._done = True
+
+    async def send_message(self, embed: Any = None, **_):
+        self._done = True
+
+
+class StubFollowup:
+    def __init__(self, channel: StubChannel):
+        self._channel = channel
+
+    async def send(self, embed: Any = None, view: Any = None, **_) -> StubMessage:
+        return await self._channel._send(embed=embed, view=view)
+
+
+class StubInteraction:
+    """
+    Slash command interaction that records what the command sent
+    """
+    _ids = count(1)
+
+    def __init__(self, user: StubUser, guild: Optional[StubGuild] = None):
+        self.id = next(self._ids)
+        self.user = user
+        self.guild = guild
+        self.guild_id = guild.id if guild is not None else None
+        self.channel = StubChannel()
+        self.created_at = datetime.now(timezone.utc)
+        self.response = StubResponse()
+        self.followup = StubFollowup(self.channel)
+
+    @property
+    def sent(self) -> List[StubMessage]:
+        return list(self.channel.messages.values())
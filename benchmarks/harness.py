@@ -0,0 +1,169 @@
+"""
+Measurement helpers and a stub bot wired to the fake services
+"""
+from asyncio import Event, get_running_loop, sleep, Task
+from clients.async_spotify import AsyncSpotify
+from clients.spotify_client import Spotify
+from dataclasses import dataclass
+from statistics import quantiles
+from time import perf_counter
+from typing import Any, Dict, List, Optional
+from util.api import APIClient
+from util.config import Config
+from util.write_behind import UpsertQueue
+from .fakes import FakeBackend, FakeSpotifyAPI, StubGuild
+import clients.async_spotify
+import spotipy
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    operations: int
+    elapsed: float
+    p50: float
+    p99: float
+    max_loop_lag: float
+
+    @property
+    def throughput(self) -> float:
+        return self.operations / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self) -> str:
+        return (f'{self.name:<28} {self.operations:>7} ops  {self.elapsed:8.2f}s  {self.throughput:10.1f} ops/s  '
+                f'p50 {self.p50 * 1000:8.2f}ms  p99 {self.p99 * 1000:8.2f}ms  '
+                f'max loop lag {self.max_loop_lag * 1000:7.2f}ms')
+
+
+class LatencyRecorder:
+    """
+    Collects per-operation latencies for one scenario
+    """
+    def __init__(self):
+        self.samples: List[float] = []
+        self._start = 0.0
+
+    def __enter__(self) -> 'LatencyRecorder':
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.elapsed = perf_counter() - self._start
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, p: int) -> float:
+        if not self.samples:
+            return 0.0
+        if len(self.samples) == 1:
+            return self.samples[0]
+        return quantiles(self.samples, n=100, method='inclusive')[p - 1]
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop runs a callback scheduled every `interval` seconds.
+    Large lag means something blocked the loop.
+    """
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.max_lag = 0.0
+        self._task: Optional[Task] = None
+
+    async def _run(self):
+        loop = get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await sleep(self.interval)
+            self.max_lag = max(self.max_lag, loop.time() - expected)
+
+    def __enter__(self) -> 'LoopLagMonitor':
+        self._task = get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *_):
+        self._task.cancel()
+
+
+def build_config(backend_url: str, prefix: str, capabilities: Optional[Dict[str, bool]] = None) -> Config:
+    host, port = backend_url.rsplit('//', 1)[1].split(':')
+    return Config(
+        data={
+            'backend': {
+                'host': host,
+                'port': int(port),
+                'prefix': prefix,
+                'auth': {'username': 'benchmark', 'password': 'benchmark'},
+                'capabilities': capabilities or {}
+            },
+            'bot': {}
+        },
+        debug=False,
+        debug_guilds=(),
+        mtime=0.0
+    )
+
+
+class BenchmarkBot:
+    """
+    Stand-in for RicoBot with the real API client, write-behind queue and Spotify facade,
+    pointed at the fake backend and fake Spotify Web API.
+    Backend capabilities are off unless given, as they are in production.
+    """
+    def __init__(self, backend: FakeBackend, spotify_api: FakeSpotifyAPI,
+                 capabilities: Optional[Dict[str, bool]] = None):
+        self.config = build_config(backend.url, backend.prefix, capabilities)
+        self.debug = False
+        self.guilds: List[StubGuild] = []
+        self._ready = Event()
+
+        self.api = APIClient(self.config)
+        self.upserts = UpsertQueue(self.api)
+
+        # Catalog lookups and playlist exports go to the fake Web API
+        spotify = Spotify('benchmark', 'benchmark')
+        spotify._client = spotipy.Spotify(auth='benchmark')
+        spotify._client.prefix = f'{spotify_api.url}/v1/'
+        clients.async_spotify.SPOTIFY_API_URL = f'{spotify_api.url}/v1'
+        self.spotify = AsyncSpotify(spotify, max_workers=16)
+
+    def get_guild(self, guild_id: int) -> Optional[StubGuild]:
+        return next((guild for guild in self.guilds if guild.id == guild_id), None)
+
+    def is_closed(self) -> bool:
+        return False
+
+    async def wait_until_ready(self):
+        # Keep background tasks such as the startup sweep from running
+        await self._ready.wait()
+
+    async def close(self):
+        await self.upserts.close()
+        await self.api.close()
+        await self.spotify.close()
+
+
+def summarize(name: str, recorder: LatencyRecorder, operations: int, lag: LoopLagMonitor) -> BenchmarkResult:
+    return BenchmarkResult(
+        name=name,
+        operations=operations,
+        elapsed=recorder.elapsed,
+        p50=recorder.percentile(50),
+        p99=recorder.percentile(99),
+        max_loop_lag=lag.max_lag
+    )
+
+
+def metrics_summary(snapshot: Dict[str, Any]) -> List[str]:
+    """
+    Summarize recorded latency histograms, one line per series
+    """
+    lines = []
+    for name, series in snapshot['histograms'].items():
+        for entry in series:
+            value = entry['value']
+            labels = ','.join(f'{k}={v}' for k, v in entry['labels'].items())
+            mean = value['sum'] / value['count'] * 1000 if value['count'] else 0.0
+            lines.append(f'  {name}{{{labels}}}: {value["count"]} calls, mean {mean:.2f}ms')
+    return lines
@@ -0,0 +1,172 @@
+"""
+Offline benchmarks for the bot's hot paths, run against in-process fakes of the backend, Spotify and Discord.
+
+Run from the repository root:
+    python -m benchmarks.run                       # all scenarios
+    python -m benchmarks.run sweep listnotes       # selected scenarios
+    python -m benchmarks.run --latency 0.005       # add 5 ms to every fake backend and Spotify request
+    python -m benchmarks.run --bulk                # use the backend's bulk note endpoints
+"""
+from argparse import ArgumentParser
+from asyncio import gather, run
+from cogs.export import ExportCog
+from cogs.notes import NotesCog
+from cogs.thread import ThreadsCog
+from datetime import datetime, timedelta
+from time import perf_counter
+from typing import Awaitable, Callable, Dict
+from util.metrics import metrics
+from util.rate_limiter import RateLimiter
+from .fakes import FakeBackend, FakeSpotifyAPI, StubGuild, StubInteraction, StubThread, StubUser
+from .harness import BenchmarkBot, BenchmarkResult, LatencyRecorder, LoopLagMonitor, metrics_summary, summarize
+
+
+async def bench_sweep(bot: BenchmarkBot, backend: FakeBackend, threads: int = 10000, archived_ratio: float = 0.1,
+                      discord_latency: float = 0.0) -> BenchmarkResult:
+    """
+    Sweep a guild with `threads` threads through ThreadsCog.unarchive_threads_guild.
+    Discord's rate limits are lifted, so this measures the bot's own overhead.
+    """
+    guild = StubGuild(1000)
+    guild.threads = [
+        StubThread(i, guild, archived=i % round(1 / archived_ratio) == 0, edit_latency=discord_latency)
+        for i in range(threads)
+    ]
+    backend.guilds[guild.id] = {'id': guild.id, 'name': guild.name, 'manage_threads': True}
+    backend.excluded_threads[guild.id] = set(range(0, threads, 97))
+    bot.guilds.append(guild)
+
+    cog = ThreadsCog(bot)
+    cog._limiter = RateLimiter(global_rate=(10 ** 9, 1), guild_rate=(10 ** 9, 1))
+    recorder = LatencyRecorder()
+    edit_thread = cog.edit_thread
+    async def timed_edit(thread, **kwargs):
+        start = perf_counter()
+        result = await edit_thread(thread, **kwargs)
+        recorder.record(perf_counter() - start)
+        return result
+    cog.edit_thread = timed_edit
+
+    try:
+        with LoopLagMonitor() as lag, recorder:
+            report = await cog.unarchive_threads_guild(guild)
+    finally:
+        cog.cog_unload()
+    return summarize(f'sweep ({report.unarchived} unarchived)', recorder, report.scanned, lag)
+
+
+async def bench_addnote(bot: BenchmarkBot, _: FakeBackend, commands: int = 1000) -> BenchmarkResult:
+    """
+    Run `commands` concurrent /addnote invocations, half Spotify tracks and half text
+    """
+    cog = NotesCog(bot)
+    guild = StubGuild(2000)
+    recorder = LatencyRecorder()
+
+    async def add_note(i: int):
+        itx = StubInteraction(StubUser(10000 + i % 50), guild)
+        content = f'https://open.spotify.com/track/{i:022d}' if i % 2 else f'note number {i}'
+        start = perf_counter()
+        await NotesCog.add_note.callback(cog, itx, note=content, recipient=StubUser(20000 + i % 100))
+        recorder.record(perf_counter() - start)
+
+    with LoopLagMonitor() as lag, recorder:
+        await gather(*[add_note(i) for i in range(commands)])
+    return summarize('addnote', recorder, commands, lag)
+
+
+async def bench_spotifyexport(bot: BenchmarkBot, backend: FakeBackend, tracks: int = 5000) -> BenchmarkResult:
+    """
+    Export `tracks` Spotify track notes to a playlist and remove them, as /spotifyexport does
+    """
+    user_id = 30000
+    backend.add_notes(False, user_id, tracks, note_type='spotify:track')
+    backend.spotify_auth[user_id] = {
+        'refresh_token': 'benchmark',
+        'access_token': 'benchmark',
+        'expires_at': (datetime.now() + timedelta(hours=1)).timestamp()
+    }
+    cog = ExportCog(bot)
+
+    # Time each chunk added to the playlist
+    recorder = LatencyRecorder()
+    export_playlist = bot.spotify.export_playlist
+    async def timed_export(*args, **kwargs):
+        export = await export_playlist(*args, **kwargs)
+        for timing in export.chunk_timings:
+            recorder.record(timing.elapsed)
+        return export
+    bot.spotify.export_playlist = timed_export
+
+    with LoopLagMonitor() as lag, recorder:
+        uris = []
+        note_ids = []
+        async for note in bot.api.iter_user_notes(user_id):
+            uris.append(f'spotify:track:{note.url.rsplit("/", 1)[1]}')
+            note_ids.append(note.id)
+        await cog.export_and_remove(user_id, 'benchmark', uris, note_ids)
+    return summarize('spotifyexport (per chunk)', recorder, tracks, lag)
+
+
+async def bench_listnotes(bot: BenchmarkBot, backend: FakeBackend, notes: int = 10000, flips: int = 200) -> BenchmarkResult:
+    """
+    Show /listnotes for a user with `notes` notes, then page forward `flips` times
+    """
+    user_id = 40000
+    backend.add_notes(False, user_id, notes)
+    cog = NotesCog(bot)
+    itx = StubInteraction(StubUser(user_id))
+    recorder = LatencyRecorder()
+
+    with LoopLagMonitor() as lag, recorder:
+        start = perf_counter()
+        await NotesCog.list.callback(cog, itx)
+        recorder.record(perf_counter() - start)
+
+        paginator = itx.sent[0].view.paginator
+        for _ in range(flips):
+            start = perf_counter()
+            await paginator.next_page()
+            recorder.record(perf_counter() - start)
+    await paginator.expire()
+    return summarize('listnotes (per page)', recorder, flips + 1, lag)
+
+
+SCENARIOS: Dict[str, Callable[..., Awaitable[BenchmarkResult]]] = {
+    'sweep': bench_sweep,
+    'addnote': bench_addnote,
+    'spotifyexport': bench_spotifyexport,
+    'listnotes': bench_listnotes
+}
+
+
+async def main(scenarios: list, latency: float, capabilities: Dict[str, bool]):
+    for name in scenarios:
+        backend = FakeBackend(latency=latency)
+        spotify_api = FakeSpotifyAPI(latency=latency)
+        await backend.start()
+        await spotify_api.start()
+        bot = BenchmarkBot(backend, spotify_api, capabilities)
+        try:
+            print(await SCENARIOS[name](bot, backend))
+        finally:
+            await bot.close()
+            await backend.stop()
+            await spotify_api.stop()
+
+    print('\nRecorded latencies:')
+    print('\n'.join(metrics_summary(metrics.snapshot())))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Run offline benchmarks against fake services')
+    parser.add_argument('scenarios', nargs='*', help=f'Scenarios to run ({", ".join(SCENARIOS)}), all by default')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds of latency to add to each fake request')
+    parser.add_argument('--bulk', action='store_true',
+                        help='Enable the bulk_add_notes and bulk_delete_notes backend capabilities, which are off by default')
+    args = parser.parse_args()
+    for scenario in args.scenarios:
+        if scenario not in SCENARIOS:
+            parser.error(f'unknown scenario: {scenario}')
+    capabilities = {'bulk_add_notes': True, 'bulk_delete_notes': True} if args.bulk else {}
+    run(main(args.scenarios or list(SCENARIOS), args.latency, capabilities))
@@ -0,0 +1,53 @@
+"""
+Micro-benchmark for note content classification.
+Compares the single-pass classify_url against the previous check_url -> check_spotify_url -> parse_spotify_url path.
+
+Run from the repository root:
+    python -m benchmarks.url_classifier
+"""
+from timeit import repeat
+from urllib.parse import urlparse
+from util.string_util import check_url, classify_url
+import re
+
+
+SAMPLES = [
+    'https://open.spotify.com/track/4cOdK2wGLETKBW3PvgPWqT?si=1a2b3c4d5e6f',
+    'https://open.spotify.com/album/1DFixLWuPkv3KT3TnV35m3',
+    'https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=42s',
+    'https://youtu.be/dQw4w9WgXcQ',
+    'https://github.com/deckardsworkspace/rico-bot',
+    'example.com',
+    'you should really listen to this album',
+]
+
+
+def legacy_classify(content: str):
+    """
+    The classification path create_note used before classify_url
+    """
+    if check_url(content):
+        if re.match(r"(https?://open\.)*spotify(\.com)*[/:]+(track|artist|album|playlist)[/:]+[A-Za-z0-9]+", content) is not None:
+            # parse_spotify_url re-checked the URL before splitting it
+            if re.match(r"(https?://open\.)*spotify(\.com)*[/:]+(track|artist|album|playlist)[/:]+[A-Za-z0-9]+", content) is None:
+                return None
+            if re.match(r"^https?://open\.spotify\.com", content):
+                parsed_path = urlparse(content).path.split("/")[1:]
+            elif re.match(r"^spotify:[a-z]", content):
+                parsed_path = content.split(":")[1:]
+            else:
+                return None
+            return parsed_path[0], parsed_path[1]
+        return 'url', urlparse(content).netloc
+    return 'text', content
+
+
+def main(number: int = 2000, rounds: int = 5):
+    for name, classify in [('legacy', legacy_classify), ('classify_url', classify_url)]:
+        best = min(repeat(lambda: [classify(sample) for sample in SAMPLES], number=number, repeat=rounds))
+        per_call = best / (number * len(SAMPLES)) * 1e6
+        print(f'{name:>14}: {per_call:8.2f} us per call')
+
+
+if __name__ == '__main__':
+    main()
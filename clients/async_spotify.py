@@ -0,0 +1,272 @@
+import pendulum
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+from asyncio import create_task, get_running_loop, Semaphore, sleep, wait_for
+from concurrent.futures import ThreadPoolExecutor
+from dataclass.playlist_export import ChunkTiming, PlaylistExport
+from dataclass.spotify_auth import SpotifyCredentials
+from functools import partial
+from time import monotonic, perf_counter
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+from util.cache import TTLCache
+from util.exceptions import SpotifyAPIError, SpotifyTooManyTracksError
+from util.list_util import list_chunks
+from util.metrics import metrics
+from .spotify_client import Spotify, TRACK_PAGE_LIMITS
+from .spotify_resolver import SpotifyBatchResolver
+
+
+SPOTIFY_API_URL = 'https://api.spotify.com/v1'
+
+
+class AsyncSpotify:
+    """
+    Awaitable facade over the Spotify client.
+    Blocking spotipy and requests calls run on a bounded thread pool, each with a timeout,
+    so a slow Spotify response never holds up the event loop.
+    """
+    def __init__(self, spotify: Spotify, max_workers: int = 8, timeout: float = 10,
+                 page_concurrency: int = 4, max_retries: int = 3):
+        self._spotify = spotify
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='spotify')
+        self._timeout = timeout
+        self._page_concurrency = page_concurrency
+
+        # Pooled Web API session for playlist exports, created on first use
+        self._sesh: Optional[ClientSession] = None
+        self._max_retries = max_retries
+        self._backoff_until = 0.0
+        self._profiles = TTLCache(max_size=256, ttl=3600)
+
+        # Batches concurrent lookups into multi-ID requests
+        self._resolver = SpotifyBatchResolver(spotify, executor=self._executor)
+
+    @property
+    def sync(self) -> Spotify:
+        return self._spotify
+
+    async def close(self):
+        if self._sesh is not None and not self._sesh.closed:
+            await self._sesh.close()
+        self._executor.shutdown(wait=False)
+
+    def _get_session(self) -> ClientSession:
+        if self._sesh is None or self._sesh.closed:
+            self._sesh = ClientSession(
+                connector=TCPConnector(limit_per_host=8),
+                timeout=ClientTimeout(total=self._timeout)
+            )
+        return self._sesh
+
+    async def _request(self, verb: str, url: str, access_token: str, data: Optional[Dict[str, Any]] = None) -> Tuple[int, Any]:
+        """
+        Make a Web API request on the pooled session.
+        On a 429, all requests hold off for as long as Spotify asks before this one is retried,
+        up to `max_retries` times.
+        """
+        for attempt in range(self._max_retries + 1):
+            wait = self._backoff_until - monotonic()
+            if wait > 0:
+                await sleep(wait)
+
+            start = perf_counter()
+            async with self._get_session().request(verb, url, json=data, headers={
+                'Authorization': f'Bearer {access_token}'
+            }) as response:
+                metrics.observe('spotify_call_duration_seconds', perf_counter() - start,
+                                method=f'web_api_{verb.lower()}', status=response.status)
+                if response.status == 429 and attempt < self._max_retries:
+                    retry_after = float(response.headers.get('Retry-After', 1))
+                    self._backoff_until = max(self._backoff_until, monotonic() + retry_after)
+                    continue
+                return response.status, await response.json(content_type=None)
+
+    async def _get_user_id(self, access_token: str) -> str:
+        """
+        Get the Spotify user ID for an access token, cached per token
+        """
+        user_id = self._profiles.get(access_token)
+        if user_id is None:
+            url = f'{SPOTIFY_API_URL}/me'
+            status, body = await self._request('GET', url, access_token)
+            if status != 200:
+                raise SpotifyAPIError('GET', url, status, body)
+            user_id = body['id']
+            self._profiles.set(access_token, user_id)
+        return user_id
+
+    async def _run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run a blocking call on the thread pool
+        """
+        loop = get_running_loop()
+        status = 'error'
+        start = perf_counter()
+        try:
+            result = await wait_for(loop.run_in_executor(self._executor, partial(func, *args, **kwargs)), timeout=self._timeout)
+            status = 'ok'
+            return result
+        finally:
+            metrics.observe('spotify_call_duration_seconds', perf_counter() - start, method=func.__name__, status=status)
+
+    async def check_renew(self, token_data: SpotifyCredentials) -> SpotifyCredentials:
+        return await self._run(self._spotify.check_renew, token_data)
+
+    async def create_auth_url(self) -> Tuple[str, str, str]:
+        return self._spotify.create_auth_url()
+
+    async def create_playlist(self, token_data: SpotifyCredentials, username: str, tracks: List[str]) -> Tuple[SpotifyCredentials, str, str]:
+        """
+        Create playlist out of a list of Spotify URIs.
+
+        :param token_data: SpotifyCredentials object
+        :param username: Discord username (for playlist description)
+        :param tracks: List of Spotify URIs
+        :return: SpotifyCredentials object, playlist name, playlist ID
+        """
+        result = await self.export_playlist(token_data, username, tracks)
+        return result.credentials, result.playlist_name, result.playlist_id
+
+    async def export_playlist(self, token_data: SpotifyCredentials, username: str, tracks: List[str],
+                              resume: Optional[PlaylistExport] = None,
+                              progress: Optional[Callable[[PlaylistExport], None]] = None) -> PlaylistExport:
+        """
+        Create playlist out of a list of Spotify URIs.
+        Chunks of tracks are appended strictly one after another. Don't send them concurrently:
+        Spotify applies appends in arrival order, so the playlist would end up shuffled, and any fix based on
+        explicit positions gets chunks that arrive early rejected and resent, wasting rate limit.
+
+        :param token_data: SpotifyCredentials object
+        :param username: Discord username (for playlist description)
+        :param tracks: List of Spotify URIs
+        :param resume: Export of the same tracks that failed partway; its playlist is reused
+            and only the tracks it hasn't added yet are appended
+        :param progress: Called with the export once the playlist exists and after every chunk,
+            so the caller can record it for a retry
+        :return: PlaylistExport with new credentials, playlist name and ID, and per-chunk timings
+        """
+        start = monotonic()
+        credentials = await self.check_renew(token_data)
+        access_token = credentials.access_token
+
+        if resume is not None:
+            result = resume
+            result.credentials = credentials
+        else:
+            # Create playlist
+            user_id = await self._get_user_id(access_token)
+            create_url = f'{SPOTIFY_API_URL}/users/{user_id}/playlists'
+            status, body = await self._request('POST', create_url, access_token, data={
+                'name': 'Rico dump ({})'.format(pendulum.now('Asia/Manila').to_formatted_date_string()),
+                'public': False,
+                'collaborative': False,
+                'description': 'Songs recommended to {} through Rico the Discord bot'.format(username)
+            })
+            if status not in [200, 201]:
+                raise SpotifyAPIError('POST', create_url, status, body)
+            result = PlaylistExport(credentials=credentials, playlist_name=body['name'], playlist_id=body['id'])
+        if progress is not None:
+            progress(result)
+
+        # Add tracks to playlist
+        add_url = f'{SPOTIFY_API_URL}/playlists/{result.playlist_id}/tracks'
+        try:
+            for chunk in list_chunks(tracks[result.tracks_added:], num_per_chunk=100):
+                chunk = list(chunk)
+                chunk_start = monotonic()
+                status, body = await self._request('POST', add_url, access_token, data={
+                    'uris': chunk
+                })
+                if status not in [200, 201]:
+                    raise SpotifyAPIError('POST', add_url, status, body)
+                result.tracks_added += len(chunk)
+                result.chunk_timings.append(ChunkTiming(
+                    index=len(result.chunk_timings),
+                    tracks=len(chunk),
+                    elapsed=monotonic() - chunk_start
+                ))
+                if progress is not None:
+                    progress(result)
+        finally:
+            result.elapsed += monotonic() - start
+        return result
+
+    async def get_entity(self, entity_type: str, entity_id: str) -> Dict[str, Any]:
+        return await self._run(self._spotify.get_entity, entity_type, entity_id)
+
+    async def get_entities(self, entity_type: str, entity_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        return await self._run(self._spotify.get_entities, entity_type, list(entity_ids))
+
+    async def resolve(self, entity_type: str, entity_id: str) -> Dict[str, Any]:
+        """
+        Get catalog metadata for an entity.
+        Lookups made around the same time are served together through the multi-ID endpoints.
+        """
+        cache = self._spotify.cache
+        data = cache.get_memory(entity_type, entity_id)
+        if data is None and cache.persistent:
+            # Redis or SQLite lookups block, so they go on the thread pool
+            data = await self._run(cache.get, entity_type, entity_id)
+        if data is None:
+            start = perf_counter()
+            data = await wait_for(self._resolver.resolve(entity_type, entity_id), timeout=self._timeout)
+            metrics.observe('spotify_call_duration_seconds', perf_counter() - start, method='resolve', status='ok')
+        return data
+
+    async def resolve_many(self, uris: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        return await self._run(self._spotify.resolve_many, list(uris))
+
+    async def get_album_art(self, album_id: str) -> str:
+        return await self._run(self._spotify.get_album_art, album_id)
+
+    async def get_artist_image(self, artist_id: str) -> str:
+        return await self._run(self._spotify.get_artist_image, artist_id)
+
+    async def get_playlist_cover(self, playlist_id: str, default: str) -> str:
+        return await self._run(self._spotify.get_playlist_cover, playlist_id, default)
+
+    async def get_top_seeds(self, access_token: str) -> Tuple[List[str], List[str]]:
+        return await self._run(self._spotify.get_top_seeds, access_token)
+
+    async def get_track_art(self, track_id: str) -> str:
+        return await self._run(self._spotify.get_track_art, track_id)
+
+    async def get_track(self, track_id: str) -> Tuple[str, str, str, int]:
+        return await self._run(self._spotify.get_track, track_id)
+
+    async def get_tracks(self, list_type: str, list_id: str,
+                         max_tracks: Optional[int] = None) -> Tuple[str, str, List[Tuple[str, str, str, int]]]:
+        list_name, list_author = await self._run(self._spotify.get_track_list_info, list_type, list_id)
+        tracks = [track async for track in self.iter_tracks(list_type, list_id, max_tracks=max_tracks)]
+        return list_name, list_author, tracks
+
+    async def iter_tracks(self, list_type: str, list_id: str,
+                          max_tracks: Optional[int] = None) -> AsyncIterator[Tuple[str, str, str, int]]:
+        """
+        Yield the tracks in an album or playlist in order, as soon as each page arrives.
+        The first page gives the total, and the rest of the pages are fetched concurrently.
+        Raises SpotifyTooManyTracksError after the first page if the list has more than `max_tracks` tracks.
+        """
+        total, tracks = await self._run(self._spotify.get_track_page, list_type, list_id)
+        if max_tracks is not None and total > max_tracks:
+            raise SpotifyTooManyTracksError(total, max_tracks)
+        for track in tracks:
+            yield track
+
+        semaphore = Semaphore(self._page_concurrency)
+        async def get_page(offset: int) -> List[Tuple[str, str, str, int]]:
+            async with semaphore:
+                _, page = await self._run(self._spotify.get_track_page, list_type, list_id, offset)
+            return page
+
+        offsets = range(TRACK_PAGE_LIMITS[list_type], total, TRACK_PAGE_LIMITS[list_type])
+        tasks = [create_task(get_page(offset)) for offset in offsets]
+        try:
+            for task in tasks:
+                for track in await task:
+                    yield track
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def request_token(self, code=None, verifier=None, refresh_token=None) -> Tuple[str, float, str]:
+        return await self._run(self._spotify.request_token, code=code, verifier=verifier, refresh_token=refresh_token)
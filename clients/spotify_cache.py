@@ -0,0 +1,104 @@
+import json
+import sqlite3
+from redis import Redis, RedisError
+from threading import Lock
+from time import time
+from typing import Any, Dict, Optional
+from util.cache import TTLCache
+
+
+class SpotifyMetadataCache:
+    """
+    Two-tier cache for Spotify catalog metadata, keyed by (entity type, entity ID).
+    The first tier is an in-memory LRU; the optional second tier (SQLite or Redis) survives restarts.
+    Safe to use from several threads at once.
+    """
+    def __init__(self, max_size: int = 2048, ttl: float = 86400,
+                 sqlite_path: Optional[str] = None, redis_url: Optional[str] = None):
+        self._memory = TTLCache(max_size=max_size, ttl=ttl)
+        self._memory_lock = Lock()
+        self._ttl = ttl
+
+        # Persistent tier
+        self._lock = Lock()
+        self._sqlite: Optional[sqlite3.Connection] = None
+        self._redis: Optional[Redis] = None
+        if redis_url is not None:
+            self._redis = Redis.from_url(redis_url)
+        elif sqlite_path is not None:
+            self._sqlite = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._sqlite.execute(
+                'CREATE TABLE IF NOT EXISTS spotify_metadata ('
+                'entity_type TEXT NOT NULL, entity_id TEXT NOT NULL, data TEXT NOT NULL, expires_at REAL NOT NULL, '
+                'PRIMARY KEY (entity_type, entity_id))'
+            )
+            self._sqlite.commit()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._memory_lock:
+            return self._memory.stats
+
+    @property
+    def persistent(self) -> bool:
+        return self._redis is not None or self._sqlite is not None
+
+    def get_memory(self, entity_type: str, entity_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get cached metadata for an entity from the in-memory tier only, which never blocks on I/O
+        """
+        with self._memory_lock:
+            return self._memory.get((entity_type, entity_id))
+
+    def get(self, entity_type: str, entity_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get cached metadata for an entity, or None if it isn't cached.
+        May block on the persistent tier, so call it off the event loop.
+        """
+        with self._memory_lock:
+            data = self._memory.get((entity_type, entity_id))
+        if data is None:
+            data = self._get_persistent(entity_type, entity_id)
+            if data is not None:
+                # Promote to memory
+                with self._memory_lock:
+                    self._memory.set((entity_type, entity_id), data)
+        return data
+
+    def set(self, entity_type: str, entity_id: str, data: Dict[str, Any]):
+        """
+        Store metadata for an entity in both tiers
+        """
+        with self._memory_lock:
+            self._memory.set((entity_type, entity_id), data)
+        self._set_persistent(entity_type, entity_id, data)
+
+    def _get_persistent(self, entity_type: str, entity_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            if self._redis is not None:
+                raw = self._redis.get(f'rico:spotify:{entity_type}:{entity_id}')
+                return json.loads(raw) if raw is not None else None
+            if self._sqlite is not None:
+                with self._lock:
+                    row = self._sqlite.execute(
+                        'SELECT data FROM spotify_metadata WHERE entity_type = ? AND entity_id = ? AND expires_at > ?',
+                        (entity_type, entity_id, time())
+                    ).fetchone()
+                return json.loads(row[0]) if row is not None else None
+        except (RedisError, sqlite3.Error) as e:
+            print(f'Error reading Spotify metadata cache: {e}')
+        return None
+
+    def _set_persistent(self, entity_type: str, entity_id: str, data: Dict[str, Any]):
+        try:
+            if self._redis is not None:
+                self._redis.setex(f'rico:spotify:{entity_type}:{entity_id}', int(self._ttl), json.dumps(data))
+            elif self._sqlite is not None:
+                with self._lock:
+                    self._sqlite.execute(
+                        'INSERT OR REPLACE INTO spotify_metadata VALUES (?, ?, ?, ?)',
+                        (entity_type, entity_id, json.dumps(data), time() + self._ttl)
+                    )
+                    self._sqlite.commit()
+        except (RedisError, sqlite3.Error) as e:
+            print(f'Error writing Spotify metadata cache: {e}')
@@ -1,4 +1,3 @@
-import pendulum
 import pkce
 import requests
 import spotipy
@@ -7,11 +6,22 @@ import urllib.parse
 import uuid
 from dataclass.spotify_auth import SpotifyCredentials
 from datetime import datetime
+from util.enums import SpotifyEntityType
 from util.exceptions import SpotifyInsufficientAccessError, SpotifyInvalidURLError
 from util.list_util import list_chunks
-from ratelimit import limits
+from util.string_util import check_spotify_id, parse_spotify_url
+from spotipy.exceptions import SpotifyException
 from spotipy.oauth2 import SpotifyClientCredentials
-from typing import Dict, List, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from .spotify_cache import SpotifyMetadataCache
+from .spotify_resolver import MULTI_ID_LIMITS
+
+
+# Largest page size for each list type's tracks endpoint
+TRACK_PAGE_LIMITS = {
+    'album': 50,
+    'playlist': 100
+}
 
 
 def extract_track_info(track_obj) -> Tuple[str, str, str, int]:
@@ -27,13 +37,16 @@ def extract_track_info(track_obj) -> Tuple[str, str, str, int]:
 
 
 class Spotify:
-    def __init__(self, client_id: str, client_secret: str):
+    def __init__(self, client_id: str, client_secret: str, cache: Optional[SpotifyMetadataCache] = None):
         self.redirect_uri = 'https://rico.dantis.me/spotify_auth'
         self.client_id = client_id
 
         # Initialize client
         auth_manager = SpotifyClientCredentials(client_id=self.client_id, client_secret=client_secret)
         self._client = spotipy.Spotify(auth_manager=auth_manager)
+
+        # Catalog metadata cache
+        self._cache = cache if cache is not None else SpotifyMetadataCache()
     
     def check_renew(self, token_data: SpotifyCredentials) -> SpotifyCredentials:
         access_token = token_data.access_token
@@ -41,7 +54,7 @@ class Spotify:
         expires_at = token_data.expires_at
 
         # Check if the token is almost expired (within 15 sec)
-        if expires_at.timestamp - time.time() <= 15:
+        if expires_at.timestamp() - time.time() <= 15:
             # Request new token
             access_token, expires_at_f, refresh_token = self.request_token(refresh_token=refresh_token)
             expires_at = datetime.fromtimestamp(expires_at_f)
@@ -80,71 +93,105 @@ class Spotify:
 
         return url, verifier, state
 
-    @limits(calls=10, period=5)
-    def create_playlist(self, token_data: SpotifyCredentials, username: str, tracks: List[str]) -> Tuple[SpotifyCredentials, str, str]:
+    @property
+    def client(self) -> spotipy.Spotify:
+        return self._client
+
+    @property
+    def cache(self) -> SpotifyMetadataCache:
+        return self._cache
+
+    def get_entity(self, entity_type: str, entity_id: str) -> Dict[str, Any]:
+        """
+        Get catalog metadata for an album, artist, playlist, or track, from cache if possible
         """
-        Create playlist out of a list of Spotify URIs.
+        data = self._cache.get(entity_type, entity_id)
+        if data is None:
+            if entity_type == SpotifyEntityType.ALBUM.value:
+                data = self.client.album(entity_id)
+            elif entity_type == SpotifyEntityType.ARTIST.value:
+                data = self.client.artist(entity_id)
+            elif entity_type == SpotifyEntityType.PLAYLIST.value:
+                data = self.client.playlist(entity_id, fields='name,owner.display_name')
+            elif entity_type == SpotifyEntityType.TRACK.value:
+                data = self.client.track(entity_id)
+            else:
+                raise SpotifyInvalidURLError(f'spotify:{entity_type}:{entity_id}')
+            self._cache.set(entity_type, entity_id, data)
+        return data
 
-        :param token_data: SpotifyCredentials object
-        :param username: Discord username (for playlist description)
-        :param tracks: List of Spotify URIs
-        :return: SpotifyCredentials object, playlist name, playlist ID
+    def get_entities(self, entity_type: str, entity_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
         """
-        # Get auth credentials
-        credentials = self.check_renew(token_data)
-
-        # Who are we?
-        profile_req = requests.get("https://api.spotify.com/v1/me", headers={
-            "Authorization": "Bearer {}".format(credentials.access_token)
-        })
-        if profile_req.status_code != 200:
-            profile_req.raise_for_status()
-        user_id = profile_req.json()['id']
-
-        # Create playlist
-        playlist_headers = {
-            "Authorization": "Bearer {}".format(credentials.access_token),
-            "Content-Type": "application/json"
-        }
-        create_params = {
-            "name": "Rico dump ({})".format(pendulum.now('Asia/Manila').to_formatted_date_string()),
-            "public": False,
-            "collaborative": False,
-            "description": "Songs recommended to {} through Rico the Discord bot".format(username)
-        }
-        create_url = "https://api.spotify.com/v1/users/{}/playlists".format(user_id)
-        create_req = requests.post(create_url, json=create_params, headers=playlist_headers)
-        if create_req.status_code not in [200, 201]:
-            create_req.raise_for_status()
-        playlist_name = create_req.json()['name']
-        playlist_id = create_req.json()['id']
-
-        # Add tracks to playlist
-        add_url = "https://api.spotify.com/v1/playlists/{}/tracks".format(playlist_id)
-        for chunk in list_chunks(tracks, num_per_chunk=100):
-            add_params = {"uris": chunk}
-            add_req = requests.post(add_url, json=add_params, headers=playlist_headers)
-            if add_req.status_code != 200:
-                add_req.raise_for_status()
-            time.sleep(0.25)  # Rate limit
-
-        # Return new tokens and playlist ID
-        return credentials, playlist_name, playlist_id
+        Get catalog metadata for many entities of the same type, using Spotify's multi-ID endpoints where available.
+        Returns a dict of entity ID to metadata, leaving out malformed IDs and entities that weren't found.
+        """
+        result = {}
+        missing = []
+        for entity_id in dict.fromkeys(entity_ids):
+            if entity_type in MULTI_ID_LIMITS and not check_spotify_id(entity_id):
+                # Would fail the whole multi-ID request
+                continue
+            data = self._cache.get(entity_type, entity_id)
+            if data is not None:
+                result[entity_id] = data
+            else:
+                missing.append(entity_id)
+
+        if entity_type not in MULTI_ID_LIMITS:
+            # No multi-ID endpoint for playlists
+            for entity_id in missing:
+                try:
+                    result[entity_id] = self.get_entity(entity_type, entity_id)
+                except SpotifyException:
+                    pass
+            return result
+
+        for chunk in list_chunks(missing, num_per_chunk=MULTI_ID_LIMITS[entity_type]):
+            chunk = list(chunk)
+            if entity_type == SpotifyEntityType.ALBUM.value:
+                response = self.client.albums(chunk)['albums']
+            elif entity_type == SpotifyEntityType.ARTIST.value:
+                response = self.client.artists(chunk)['artists']
+            else:
+                response = self.client.tracks(chunk)['tracks']
+
+            # Results are in the same order as the requested IDs, with nulls for unknown IDs
+            for entity_id, data in zip(chunk, response):
+                if data is not None:
+                    self._cache.set(entity_type, entity_id, data)
+                    result[entity_id] = data
+        return result
+
+    def resolve_many(self, uris: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Get catalog metadata for many Spotify links or URIs of any type, in as few requests as possible.
+        Returns a dict of link or URI to metadata, leaving out invalid links and entities that weren't found.
+        """
+        by_type: Dict[str, Dict[str, List[str]]] = {}
+        for uri in uris:
+            try:
+                entity_type, entity_id = parse_spotify_url(uri)
+            except SpotifyInvalidURLError:
+                continue
+            by_type.setdefault(entity_type, {}).setdefault(entity_id, []).append(uri)
+
+        result = {}
+        for entity_type, ids in by_type.items():
+            for entity_id, data in self.get_entities(entity_type, ids.keys()).items():
+                for uri in ids[entity_id]:
+                    result[uri] = data
+        return result
 
-    @property
-    def client(self) -> spotipy.Spotify:
-        return self._client
-    
     def __get_art(self, art: List[Dict[str, str]], default='') -> str:
         if not len(art):
             return default
         return art[0]['url']
     
     def get_album_art(self, album_id: str) -> str:
-        return self.__get_art(self.client.album(album_id)['images'])
+        return self.__get_art(self.get_entity('album', album_id)['images'])
     
     def get_artist_image(self, artist_id: str) -> str:
-        return self.__get_art(self.client.artist(artist_id)['images'])
+        return self.__get_art(self.get_entity('artist', artist_id)['images'])
 
     def get_playlist_cover(self, playlist_id: str, default: str) -> str:
         return self.__get_art(self.client.playlist_cover_image(playlist_id), default=default)
@@ -174,44 +221,42 @@ class Spotify:
         return recent_tracks, recent_artists
     
     def get_track_art(self, track_id: str) -> str:
-        return self.__get_art(self.client.track(track_id)['album']['images'])
+        return self.__get_art(self.get_entity('track', track_id)['album']['images'])
 
     def get_track(self, track_id: str) -> Tuple[str, str]:
-        return extract_track_info(self.client.track(track_id))
+        return extract_track_info(self.get_entity('track', track_id))
 
-    def get_tracks(self, list_type: str, list_id: str) -> Tuple[str, str, List[Tuple[str, str, str, int]]]:
-        offset = 0
-        tracks = []
+    def get_track_list_info(self, list_type: str, list_id: str) -> Tuple[str, str]:
+        """
+        Get the name and author of an album or playlist
+        """
+        if list_type == 'album':
+            album_info = self.get_entity('album', list_id)
+            return album_info['name'], album_info['artists'][0]['name']
+        elif list_type == 'playlist':
+            playlist_info = self.get_entity('playlist', list_id)
+            return playlist_info['name'], playlist_info['owner']['display_name']
+        raise SpotifyInvalidURLError(f'spotify:{list_type}:{list_id}')
 
-        # Get list name and author
+    def get_track_page(self, list_type: str, list_id: str, offset: int = 0) -> Tuple[int, List[Tuple[str, str, str, int]]]:
+        """
+        Get one page of tracks in an album or playlist
+
+        :return: total number of tracks in the list, tracks in this page
+        """
         if list_type == 'album':
-            album_info = self.client.album(list_id)
-            list_name = album_info['name']
-            list_author = album_info['artists'][0]['name']
+            response = self.client.album_tracks(list_id, limit=TRACK_PAGE_LIMITS['album'], offset=offset)
         elif list_type == 'playlist':
-            playlist_info = self.client.playlist(list_id, fields='name,owner.display_name')
-            list_name = playlist_info['name']
-            list_author = playlist_info['owner']['display_name']
+            fields = 'total,items.track.name,items.track.artists,items.track.id,items.track.duration_ms'
+            response = self.client.playlist_items(list_id, limit=TRACK_PAGE_LIMITS['playlist'], offset=offset,
+                                                  fields=fields,
+                                                  additional_types=['track'])
         else:
             raise SpotifyInvalidURLError(f'spotify:{list_type}:{list_id}')
 
-        # Get tracks
-        while True:
-            if list_type == 'album':
-                response = self.client.album_tracks(list_id, offset=offset)
-            else:
-                fields = 'items.track.name,items.track.artists,items.track.id,items.track.duration_ms'
-                response = self.client.playlist_items(list_id, offset=offset,
-                                                      fields=fields,
-                                                      additional_types=['track'])
-
-            if len(response['items']) == 0:
-                break
-
-            tracks.extend(response['items'])
-            offset = offset + len(response['items'])
-
-        return list_name, list_author, list(map(extract_track_info, tracks))
+        # Removed and unavailable playlist tracks come back as null
+        items = [item for item in response['items'] if item.get('track', item) is not None]
+        return response['total'], list(map(extract_track_info, items))
 
     def request_token(self, code=None, verifier=None, refresh_token=None) -> Tuple[str, float, str]:
         # Perform POST request
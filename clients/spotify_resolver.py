@@ -0,0 +1,93 @@
+from asyncio import Future, gather, get_running_loop, TimerHandle
+from concurrent.futures import Executor
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+from util.enums import SpotifyEntityType
+from util.exceptions import SpotifyInvalidURLError, SpotifyNotFoundError
+from util.string_util import check_spotify_id
+if TYPE_CHECKING:
+    from .spotify_client import Spotify
+
+
+# Maximum number of IDs per request to Spotify's multi-ID endpoints
+MULTI_ID_LIMITS = {
+    SpotifyEntityType.ALBUM.value: 20,
+    SpotifyEntityType.ARTIST.value: 50,
+    SpotifyEntityType.TRACK.value: 50
+}
+
+
+class SpotifyBatchResolver:
+    """
+    Collects metadata lookups made within a short window and resolves them together,
+    so that a burst of lookups costs one multi-ID request per entity type instead of one request each.
+    Malformed IDs are rejected before they can join a batch, and if a batch fails anyway,
+    its IDs are looked up one at a time so that only the bad ones fail.
+    """
+    def __init__(self, spotify: 'Spotify', executor: Optional[Executor] = None, window: float = 0.05):
+        self._spotify = spotify
+        self._executor = executor
+        self._window = window
+        self._pending: Dict[str, Dict[str, List[Future]]] = {}
+        self._timers: Dict[str, TimerHandle] = {}
+
+    async def resolve(self, entity_type: str, entity_id: str) -> Dict[str, Any]:
+        if entity_type in MULTI_ID_LIMITS and not check_spotify_id(entity_id):
+            raise SpotifyInvalidURLError(f'spotify:{entity_type}:{entity_id}')
+
+        loop = get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(entity_type, {})
+        pending.setdefault(entity_id, []).append(future)
+
+        if len(pending) >= MULTI_ID_LIMITS.get(entity_type, 1):
+            # Batch is full, send it now
+            self._flush(entity_type)
+        elif entity_type not in self._timers:
+            self._timers[entity_type] = loop.call_later(self._window, self._flush, entity_type)
+        return await future
+
+    def _flush(self, entity_type: str):
+        timer: Optional[TimerHandle] = self._timers.pop(entity_type, None)
+        if timer is not None:
+            timer.cancel()
+        pending = self._pending.pop(entity_type, {})
+        if pending:
+            get_running_loop().create_task(self._fetch(entity_type, pending))
+
+    async def _fetch(self, entity_type: str, pending: Dict[str, List[Future]]):
+        loop = get_running_loop()
+        try:
+            result = await loop.run_in_executor(self._executor, self._spotify.get_entities, entity_type, list(pending.keys()))
+        except Exception as e:
+            if len(pending) > 1:
+                # Don't fail everyone's lookups because of one bad ID
+                await gather(*[self._fetch_one(entity_type, entity_id, futures) for entity_id, futures in pending.items()])
+                return
+            for futures in pending.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+
+        for entity_id, futures in pending.items():
+            for future in futures:
+                if future.done():
+                    continue
+                if entity_id in result:
+                    future.set_result(result[entity_id])
+                else:
+                    future.set_exception(SpotifyNotFoundError(entity_type, entity_id))
+
+    async def _fetch_one(self, entity_type: str, entity_id: str, futures: List[Future]):
+        loop = get_running_loop()
+        try:
+            data = await loop.run_in_executor(self._executor, self._spotify.get_entity, entity_type, entity_id)
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future in futures:
+            if not future.done():
+                future.set_result(data)
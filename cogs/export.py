@@ -1,26 +1,69 @@
+from aiohttp import ClientError
+from asyncio import TimeoutError
 from dataclass.custom_embed import create_error_embed, create_success_embed
+from dataclass.playlist_export import PlaylistExport
 from nextcord import Color, Embed, Interaction, slash_command
 from nextcord.ext.commands import Cog
-from ratelimit import RateLimitException
 import requests.exceptions
-from typing import TYPE_CHECKING
+from typing import List, Tuple, TYPE_CHECKING
+from util.cache import TTLCache
 from util.config import get_debug_guilds
 from util.enums import NoteType
+from util.exceptions import SpotifyAPIError, SpotifyInsufficientAccessError
 from util.string_util import parse_spotify_url
 if TYPE_CHECKING:
-    from clients.spotify_client import Spotify
+    from clients.async_spotify import AsyncSpotify
     from util.rico_bot import RicoBot
 
 
 class ExportCog(Cog):
     def __init__(self, bot: 'RicoBot'):
         self._bot = bot
+
+        # Exports whose notes haven't all been removed yet, by user ID
+        self._exports = TTLCache(max_size=1024, ttl=3600)
         print(f'Loaded cog: {self.__class__.__name__}')
 
     @property
-    def spotify(self) -> 'Spotify':
+    def spotify(self) -> 'AsyncSpotify':
         return self._bot.spotify
 
+    async def export_and_remove(self, user_id: int, username: str, tracks: List[str], note_ids: List[str]) -> Tuple[str, str]:
+        """
+        Export tracks to a new Spotify playlist using the user's saved Spotify credentials,
+        then remove the exported notes in bulk.
+        Safe to retry: the playlist is recorded as soon as it is created, so if a previous attempt
+        failed partway, the same playlist is reused, only the tracks it is missing are added,
+        and only then are the notes removed.
+
+        :return: playlist name, playlist ID
+        """
+        export = None
+        previous = self._exports.get(user_id)
+        if previous is not None and set(note_ids) <= previous[2]:
+            export, tracks, exported_ids = previous
+        else:
+            exported_ids = frozenset(note_ids)
+
+        if export is None or export.tracks_added < len(tracks):
+            credentials = await self._bot.api.get_spotify_credentials(user_id)
+            if credentials is None:
+                raise SpotifyInsufficientAccessError()
+
+            def record(progress: PlaylistExport):
+                self._exports.set(user_id, (progress, tracks, exported_ids))
+
+            # A previous attempt may have renewed the access token without saving it
+            token_data = credentials if export is None else export.credentials
+            export = await self.spotify.export_playlist(token_data, username, tracks, resume=export, progress=record)
+            if export.credentials != credentials:
+                # Access token was renewed
+                await self._bot.api.set_spotify_credentials(export.credentials)
+
+        await self._bot.api.remove_user_notes(user_id, note_ids)
+        self._exports.invalidate(user_id)
+        return export.playlist_name, export.playlist_id
+
     @slash_command(name='spotifyexport', guild_ids=get_debug_guilds())
     async def dump_spotify(self, itx: Interaction):
         """
@@ -30,37 +73,35 @@ class ExportCog(Cog):
         await itx.response.defer(ephemeral=True)
 
         # Get all Spotify tracks recommended to user
-        recs = self._bot.api.get_user_notes(itx.user.id)
         tracks = []
         to_remove = []
-        for item in recs:
-            if item.type == NoteType.SPOTIFY_TRACK:
-                _, track_id = parse_spotify_url(item.url)
-                tracks.append(f'spotify:track:{track_id}')
-                to_remove.append(item.id)
+        async for item in self._bot.api.iter_user_notes(itx.user.id, note_type=NoteType.SPOTIFY_TRACK):
+            _, track_id = parse_spotify_url(item.url)
+            tracks.append(f'spotify:track:{track_id}')
+            to_remove.append(item.id)
 
         # Add to playlist
         if len(tracks):
             try:
-                result = self._bot.api.export_to_spotify(itx.user.id, tracks)
-                playlist_name, playlist_id = result
-            except requests.exceptions.HTTPError as e:
+                playlist_name, playlist_id = await self.export_and_remove(itx.user.id, itx.user.name, tracks, to_remove)
+            except SpotifyInsufficientAccessError as e:
                 return await itx.followup.send(embed=create_error_embed(
-                    title='Could not create Spotify playlist',
-                    body=f'`{e}`\nPlease try again later.'
+                    title='Not logged in to Spotify',
+                    body=f'{e}\nLog in with `/spotifylogin` first.'
                 ))
-            except RateLimitException:
+            except (requests.exceptions.HTTPError, SpotifyAPIError, ClientError, TimeoutError) as e:
+                if isinstance(e, SpotifyAPIError) and e.status == 429:
+                    return await itx.followup.send(embed=create_error_embed(
+                        title='Rate limit exceeded',
+                        body='Please try again later.'
+                    ))
                 return await itx.followup.send(embed=create_error_embed(
-                    title='Rate limit exceeded',
-                    body='Please try again later.'
+                    title='Could not create Spotify playlist',
+                    body=f'`{e}`\nPlease try again later.'
                 ))
 
             # Get playlist art
-            icon = self.spotify.get_playlist_cover(playlist_id, default=itx.user.avatar.url)
-
-            # Delete tracks from rec list
-            for rec_id in to_remove:
-                self._bot.api.remove_user_note(itx.user.id, rec_id)
+            icon = await self.spotify.get_playlist_cover(playlist_id, default=itx.user.avatar.url)
 
             # Send link to new playlist
             desc = '\n'.join([
@@ -1,6 +1,9 @@
+from nextcord import Guild, Member
 from nextcord.ext import ipc
 from nextcord.ext.commands import Cog
 from typing import Any, TYPE_CHECKING
+from util.member_index import MemberIndex
+from util.metrics import metrics
 if TYPE_CHECKING:
     from util.api import APIClient
     from util.rico_bot import RicoBot
@@ -12,23 +15,45 @@ class IPCCog(Cog):
     """
     def __init__(self, bot: 'RicoBot'):
         self._bot = bot
+
+        # Guilds each user shares with the bot
+        self._members = MemberIndex(bot.guilds)
         print(f'Loaded cog: {self.__class__.__name__}')
 
+    @Cog.listener()
+    async def on_guild_join(self, guild: Guild):
+        self._members.add_guild(guild)
+
+    @Cog.listener()
+    async def on_guild_remove(self, guild: Guild):
+        self._members.remove_guild(guild)
+
+    @Cog.listener()
+    async def on_member_join(self, member: Member):
+        self._members.add_member(member.id, member.guild.id)
+
+    @Cog.listener()
+    async def on_member_remove(self, member: Member):
+        self._members.remove_member(member.id, member.guild.id)
+
     @ipc.server.route()
     async def get_mutual_guilds(self, data: Any):
         # Get all thread-managed guilds
-        managed_guilds = self._bot.api.get_thread_managed_guilds()
+        managed_guilds = await self._bot.api.get_thread_managed_guilds()
 
         # Get all mutual guilds
         guilds = []
-        for guild in self._bot.guilds:
-            if guild.get_member(data.user_id) is not None:
+        for guild_id in self._members.get_guilds(data.user_id):
+            guild = self._bot.get_guild(guild_id)
+            if guild is not None:
                 guilds.append({
                     'id': guild.id,
                     'name': guild.name,
-                    'icon': guild.icon.url,
+                    'icon': guild.icon.url if guild.icon is not None else None,
                     'manage_threads': guild.id in managed_guilds
                 })
-
-        print(guilds)
         return guilds
+
+    @ipc.server.route()
+    async def get_metrics(self, _: Any):
+        return metrics.snapshot()
@@ -1,44 +1,70 @@
 from dataclass.custom_embed import CustomEmbed, create_error_embed, create_success_embed
-from dataclass.note import Note
-from nextcord import Guild, Interaction, slash_command, SlashOption, User
+from dataclass.note import Note, NotePage
+from math import ceil
+from nextcord import Attachment, Embed, Guild, Interaction, slash_command, SlashOption, User
 from nextcord.ext import application_checks
 from nextcord.ext.commands import Cog
-from typing import List, Optional, TYPE_CHECKING
+from typing import Awaitable, Callable, List, Optional, TYPE_CHECKING
 from util.config import get_debug_guilds
-from util.list_util import list_chunks
+from util.enums import NoteType
+from util.exceptions import SpotifyTooManyTracksError
 from util.paginator import Paginator
-from util.note_parser import create_note
+from util.note_parser import create_note, create_notes, create_track_note
+from util.string_util import classify_url, ellipsis_truncate
+import csv
 
 if TYPE_CHECKING:
     from util.rico_bot import RicoBot
 
 
-async def paginate_notes(itx: Interaction, owner: str, notes: List[Note]):
-    # Create pages
-    pages = []
-    for chunk in list_chunks(notes, 5):
-        fields = []
-        item: Note
-        for item in chunk:
-            fields.append([
-                item.title,
-                '\n'.join([x for x in [
-                    item.url,
-                    f'added by <@{item.sender}> <t:{int(item.timestamp.timestamp())}:R>',
-                    f'ID `{item.id}`'
-                ] if x])
-            ])
-
-        # Create embed
-        pages.append(CustomEmbed(
-            title=f'Notes for {owner}',
-            description=f'{len(notes)} total',
-            fields=fields
-        ).get())
+NOTES_PER_PAGE = 5
+MAX_IMPORT_NOTES = 1000
+
+
+def parse_import_file(filename: str, data: bytes) -> List[str]:
+    """
+    Get entries to import from a text file with one entry per line,
+    or a CSV file with one entry per row in the first column
+    """
+    lines = data.decode('utf-8-sig', errors='replace').splitlines()
+    if filename.lower().endswith('.csv'):
+        entries = [row[0] for row in csv.reader(lines) if row]
+    else:
+        entries = lines
+    return [entry.strip() for entry in entries if entry.strip()]
+
+
+def create_notes_embed(owner: str, notes: List[Note], total: int) -> Embed:
+    fields = []
+    for item in notes:
+        fields.append([
+            item.title,
+            '\n'.join([x for x in [
+                item.url,
+                f'added by <@{item.sender}> <t:{int(item.timestamp.timestamp())}:R>',
+                f'ID `{item.id}`'
+            ] if x])
+        ])
+
+    return CustomEmbed(
+        title=f'Notes for {owner}',
+        description=f'{total} total',
+        fields=fields
+    ).get()
+
+
+async def paginate_notes(itx: Interaction, owner: str, first_page: NotePage,
+                         get_page: Callable[[int, int], Awaitable[NotePage]]):
+    """
+    Paginate notes, fetching each page from the backend only when it's about to be shown
+    """
+    async def render(page: int) -> Embed:
+        notes = first_page if page == 0 else await get_page(page * NOTES_PER_PAGE, NOTES_PER_PAGE)
+        return create_notes_embed(owner, notes.notes, notes.total)
 
     # Run paginator
     paginator = Paginator(itx)
-    await paginator.run(pages)
+    await paginator.run_lazy(ceil(first_page.total / NOTES_PER_PAGE), render)
 
 
 class NotesCog(Cog):
@@ -46,11 +72,11 @@ class NotesCog(Cog):
         self._bot = bot
         print(f'Loaded cog: {self.__class__.__name__}')
 
-    def _ensure_records(self, guild: Optional[Guild] = None, user: Optional[User] = None):
+    async def _ensure_records(self, guild: Optional[Guild] = None, user: Optional[User] = None):
         if guild:
-            self._bot.api.update_guild(guild.id, guild.name)
+            await self._bot.upserts.upsert_guild(guild.id, guild.name)
         if user:
-            self._bot.api.update_user(user.id, user.name, user.discriminator)
+            await self._bot.upserts.upsert_user(user.id, user.name, user.discriminator)
 
     @slash_command(name='addnote', guild_ids=get_debug_guilds())
     async def add_note(
@@ -71,12 +97,12 @@ class NotesCog(Cog):
 
         # Make sure sender and recipient are both in database
         sender = itx.user.id
-        self._ensure_records(guild=itx.guild, user=itx.user)
-        self._ensure_records(user=recipient)
+        await self._ensure_records(guild=itx.guild, user=itx.user)
+        await self._ensure_records(user=recipient)
 
         # Add note to recipient's list
-        note = create_note(self._bot.spotify, note, sender, recipient.id)
-        self._bot.api.add_user_note(recipient.id, note)
+        note = await create_note(self._bot.spotify, note, sender, recipient.id)
+        await self._bot.api.add_user_note(recipient.id, note)
         await itx.followup.send(embed=create_success_embed(
             title='Note added',
             body=f'**{note.title}** added to {recipient.mention}\'s list.'
@@ -98,16 +124,132 @@ class NotesCog(Cog):
 
         # Ensure sender is in database
         sender = itx.user.id
-        self._ensure_records(guild=itx.guild, user=itx.user)
+        await self._ensure_records(guild=itx.guild, user=itx.user)
 
         # Add note to server's list
-        note = create_note(self._bot.spotify, note, sender, itx.guild_id)
-        self._bot.api.add_guild_note(itx.guild_id, note)
+        note = await create_note(self._bot.spotify, note, sender, itx.guild_id)
+        await self._bot.api.add_guild_note(itx.guild_id, note)
         await itx.followup.send(embed=create_success_embed(
             title='Note added',
             body=f'**{note.title}** added to this server\'s list.'
         ))
 
+    async def _import_notes(self, itx: Interaction, for_guild: bool, owner: int, owner_name: str,
+                            file: Optional[Attachment], url: Optional[str]):
+        """
+        Import notes from an attachment or a Spotify album or playlist, adding them in batches
+        """
+        sender = itx.user.id
+        failed = []
+        if url is not None:
+            note_type, entity_id, _ = classify_url(url.strip())
+            if note_type not in [NoteType.SPOTIFY_ALBUM, NoteType.SPOTIFY_PLAYLIST]:
+                return await itx.followup.send(embed=create_error_embed(
+                    body='Only Spotify album and playlist links can be imported.'
+                ))
+            try:
+                _, _, tracks = await self._bot.spotify.get_tracks(note_type.value.split(':')[1], entity_id,
+                                                                  max_tracks=MAX_IMPORT_NOTES)
+            except SpotifyTooManyTracksError as e:
+                return await itx.followup.send(embed=create_error_embed(
+                    body=f'This list has {e.total} tracks. You can only import up to {MAX_IMPORT_NOTES} notes at a time.'
+                ))
+            notes = []
+            for name, artist, track_id, _ in tracks:
+                if track_id is None:
+                    # Local files in a playlist have no Spotify ID to link to
+                    failed.append(f'{name} - {artist} (local file)')
+                else:
+                    notes.append(create_track_note(name, artist, track_id, sender, owner))
+        elif file is not None:
+            entries = parse_import_file(file.filename, await file.read())
+            if len(entries) > MAX_IMPORT_NOTES:
+                return await itx.followup.send(embed=create_error_embed(
+                    body=f'This file has {len(entries)} entries. You can only import up to {MAX_IMPORT_NOTES} notes at a time.'
+                ))
+            notes, failed = await create_notes(self._bot.spotify, entries, sender, owner)
+        else:
+            return await itx.followup.send(embed=create_error_embed(
+                body='Attach a text or CSV file, or specify a Spotify album or playlist link.'
+            ))
+
+        if not len(notes):
+            return await itx.followup.send(embed=create_error_embed(body='Nothing to import.'))
+
+        # Add notes, updating progress after each batch
+        msg = await itx.followup.send(embed=create_success_embed(
+            title='Importing notes',
+            body=f'0 of {len(notes)} notes added to {owner_name}\'s list.'
+        ))
+        async def progress(added: int):
+            await msg.edit(embed=create_success_embed(
+                title='Importing notes',
+                body=f'{added} of {len(notes)} notes added to {owner_name}\'s list.'
+            ))
+        if for_guild:
+            not_added = await self._bot.api.add_guild_notes(owner, notes, progress=progress)
+        else:
+            not_added = await self._bot.api.add_user_notes(owner, notes, progress=progress)
+        failed.extend(note.title for note in not_added)
+
+        body = [f'{len(notes) - len(not_added)} notes added to {owner_name}\'s list.']
+        if len(failed):
+            body.append(f'{len(failed)} entries could not be added:')
+            body.extend(f'`{ellipsis_truncate(entry, 100)}`' for entry in failed[:10])
+        await msg.edit(embed=create_success_embed(title='Notes imported', body='\n'.join(body)))
+
+    @slash_command(name='importnotes', guild_ids=get_debug_guilds())
+    async def import_notes(
+            self,
+            itx: Interaction,
+            file: Optional[Attachment] = SlashOption(
+                description='Text file with one note per line, or CSV file with notes in the first column',
+                required=False
+            ),
+            url: Optional[str] = SlashOption(
+                description='Spotify album or playlist to add all tracks from',
+                required=False
+            ),
+            recipient: Optional[User] = SlashOption(
+                description='User to add the notes to. Defaults to you.',
+                required=False
+            )):
+        """
+        Add many notes to someone's list at once.
+        """
+        await itx.response.defer()
+
+        # Make sure sender and recipient are both in database
+        if recipient is None:
+            recipient = itx.user
+        await self._ensure_records(guild=itx.guild, user=itx.user)
+        await self._ensure_records(user=recipient)
+
+        await self._import_notes(itx, False, recipient.id, recipient.mention, file, url)
+
+    @slash_command(name='svr-importnotes', guild_ids=get_debug_guilds())
+    @application_checks.guild_only()
+    async def import_server_notes(
+            self,
+            itx: Interaction,
+            file: Optional[Attachment] = SlashOption(
+                description='Text file with one note per line, or CSV file with notes in the first column',
+                required=False
+            ),
+            url: Optional[str] = SlashOption(
+                description='Spotify album or playlist to add all tracks from',
+                required=False
+            )):
+        """
+        Add many notes to the server's list at once.
+        """
+        await itx.response.defer()
+
+        # Ensure sender is in database
+        await self._ensure_records(guild=itx.guild, user=itx.user)
+
+        await self._import_notes(itx, True, itx.guild_id, 'this server', file, url)
+
     @slash_command(name='listnotes', guild_ids=get_debug_guilds())
     async def list(self, itx: Interaction):
         """
@@ -115,13 +257,15 @@ class NotesCog(Cog):
         """
         await itx.response.defer()
 
-        # Get notes
-        notes = self._bot.api.get_user_notes(itx.user.id)
-        if not notes:
+        # Get first page of notes
+        notes = await self._bot.api.get_user_notes_page(itx.user.id, 0, NOTES_PER_PAGE)
+        if not notes.total:
             return await itx.followup.send(embed=create_error_embed(body='You have no notes.'))
 
         # Display notes
-        await paginate_notes(itx, itx.user.name, notes)
+        async def get_page(offset: int, limit: int) -> NotePage:
+            return await self._bot.api.get_user_notes_page(itx.user.id, offset, limit)
+        await paginate_notes(itx, itx.user.name, notes, get_page)
 
     @slash_command(name='svr-listnotes', guild_ids=get_debug_guilds())
     @application_checks.guild_only()
@@ -131,13 +275,15 @@ class NotesCog(Cog):
         """
         await itx.response.defer()
 
-        # Get notes
-        notes = self._bot.api.get_guild_notes(itx.guild_id)
-        if not notes:
+        # Get first page of notes
+        notes = await self._bot.api.get_guild_notes_page(itx.guild_id, 0, NOTES_PER_PAGE)
+        if not notes.total:
             return await itx.followup.send(embed=create_error_embed(body='The server doesn\'t have any notes.'))
 
         # Display notes
-        await paginate_notes(itx, itx.guild.name, notes)
+        async def get_page(offset: int, limit: int) -> NotePage:
+            return await self._bot.api.get_guild_notes_page(itx.guild_id, offset, limit)
+        await paginate_notes(itx, itx.guild.name, notes, get_page)
 
     @slash_command(name='removenote', guild_ids=get_debug_guilds())
     async def remove_note(
@@ -155,7 +301,7 @@ class NotesCog(Cog):
 
         # Remove note
         try:
-            self._bot.api.remove_user_note(itx.user.id, note_id)
+            await self._bot.api.remove_user_note(itx.user.id, note_id)
         except Exception as e:
             return await itx.followup.send(embed=create_error_embed(body=str(e)))
         else:
@@ -172,7 +318,7 @@ class NotesCog(Cog):
 
         # Clear notes
         try:
-            self._bot.api.clear_user_notes(itx.user.id)
+            await self._bot.api.clear_user_notes(itx.user.id)
         except Exception as e:
             return await itx.followup.send(embed=create_error_embed(body=str(e)))
         else:
@@ -196,7 +342,7 @@ class NotesCog(Cog):
 
         # Remove note
         try:
-            self._bot.api.remove_guild_note(itx.guild_id, note_id)
+            await self._bot.api.remove_guild_note(itx.guild_id, note_id)
         except Exception as e:
             return await itx.followup.send(embed=create_error_embed(body=str(e)))
         else:
@@ -215,7 +361,7 @@ class NotesCog(Cog):
 
         # Remove note
         try:
-            self._bot.api.clear_guild_notes(itx.guild_id)
+            await self._bot.api.clear_guild_notes(itx.guild_id)
         except Exception as e:
             return await itx.followup.send(embed=create_error_embed(body=str(e)))
         else:
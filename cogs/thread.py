@@ -1,11 +1,18 @@
-from asyncio import CancelledError, TimeoutError
+from asyncio import CancelledError, gather, Semaphore, sleep, TimeoutError
 from dataclass.custom_embed import create_error_embed, create_success_embed, CustomEmbed
-from nextcord import ApplicationError, Color, Guild, Interaction, Member, Reaction, slash_command, Thread, User
+from dataclass.sweep_report import SweepReport
+from itertools import count
+from nextcord import ApplicationError, Color, Guild, HTTPException, Interaction, Member, Message, Reaction, slash_command, Thread, User
 from nextcord.ext import application_checks, tasks
 from nextcord.ext.commands import Cog
-from ratelimit import limits, sleep_and_retry
-from typing import TYPE_CHECKING
+from nextcord.utils import snowflake_time
+from time import monotonic, time
+from typing import Iterable, TYPE_CHECKING
+from util.archive_scheduler import ArchiveScheduler
 from util.config import get_debug_guilds
+from util.metrics import metrics
+from util.rate_limiter import RateLimiter
+from util.resilience import jittered_backoff
 from util.string_util import min_to_dh
 if TYPE_CHECKING:
     from util.rico_bot import RicoBot
@@ -21,63 +28,246 @@ def is_in_thread(itx: Interaction) -> bool:
     return result
 
 
+def archive_deadline(thread: Thread) -> float:
+    """
+    Unix timestamp at which Discord will auto-archive a thread, based on its last activity
+    """
+    last_activity = thread.archive_timestamp
+    if thread.last_message_id is not None:
+        last_activity = max(last_activity, snowflake_time(thread.last_message_id))
+    return last_activity.timestamp() + thread.auto_archive_duration * 60
+
+
+def format_sweep_report(report: SweepReport) -> str:
+    """
+    Summarize the results of a thread sweep
+    """
+    return (f'{report.scanned} scanned, {report.unarchived} unarchived, {report.skipped} skipped, '
+            f'{report.errors} errors in {report.elapsed:.1f}s')
+
+
 class ThreadsCog(Cog):
     def __init__(self, bot: 'RicoBot'):
         self._bot = bot
+        self._limiter = RateLimiter(guild_rate=(15, 5))
+
+        # Sweep concurrency limits
+        thread_config = bot.config['bot'].get('threads', {})
+        self._guild_concurrency = thread_config.get('sweep_guild_concurrency', 4)
+        self._thread_concurrency = thread_config.get('sweep_thread_concurrency', 5)
+
+        # Archive deadlines of open threads in managed guilds
+        self._scheduler = ArchiveScheduler(self.on_archive_deadline)
+        self.run_scheduler.start()
+
+        # Full sweeps, on startup and then as a safety net for anything the scheduler missed
+        self.main.change_interval(seconds=thread_config.get('sweep_interval', 6 * 3600))
         self.main.start()
         print(f'Loaded cog: {self.__class__.__name__}')
     
+    def cog_unload(self):
+        self.main.cancel()
+        self.run_scheduler.cancel()
+
     async def cog_application_command_before_invoke(self, itx: Interaction):
         """
         Ensure that the guild exists in the database before processing any commands
         """
-        self._bot.api.update_guild(itx.guild_id, itx.guild.name)
+        await self._bot.upserts.upsert_guild(itx.guild_id, itx.guild.name)
 
-    @tasks.loop(seconds=3600)
+    @tasks.loop(hours=6)
     async def main(self):
         """
-        Keep threads unarchived for monitored guilds. Run every hour.
+        Keep threads unarchived for monitored guilds.
+        Sweeps on startup and every few hours after that; in between, the scheduler wakes up
+        whenever a thread's archive deadline passes. A failed sweep is retried with backoff.
+        """
+        for attempt in count():
+            if self._bot.is_closed():
+                return
+            try:
+                report = await self.unarchive_threads_guilds(self._bot.guilds)
+            except Exception as e:
+                delay = jittered_backoff(attempt, 5, 300)
+                print(f'Thread sweep failed, retrying in {delay:.0f}s: {e}')
+                await sleep(delay)
+            else:
+                if self._bot.debug:
+                    print(f'[DEBUG] Thread sweep finished: {report}, tracking {len(self._scheduler)} threads')
+                return
+
+    @tasks.loop(count=1)
+    async def run_scheduler(self):
+        """
+        Check threads as their archive deadlines pass
         """
-        if not self._bot.is_closed():
-            for guild in self._bot.guilds:
-                if guild.id in self._bot.api.get_thread_managed_guilds():
-                    await self.unarchive_threads_guild(guild)
+        await self._scheduler.run()
 
     @main.before_loop
+    @run_scheduler.before_loop
     async def before_main(self):
         """
         Wait until client is ready before housekeeping
         """
         await self._bot.wait_until_ready()
 
-    @sleep_and_retry
-    @limits(calls=15, period=5)
-    async def unarchive_thread(self, guild_id: int, thread: Thread):
+    async def edit_thread(self, thread: Thread, **kwargs):
         """
-        Unarchive a thread if not excluded from monitoring
+        Edit a thread, waiting for the rate limiter and retrying if Discord responds with a 429
         """
+        for attempt in range(3):
+            await self._limiter.acquire(thread.guild.id)
+            try:
+                return await thread.edit(**kwargs)
+            except HTTPException as e:
+                if e.status != 429 or attempt == 2:
+                    raise
+
+                # Hold off further edits for as long as Discord asks us to
+                retry_after = float(e.response.headers.get('Retry-After', 1))
+                is_global = e.response.headers.get('X-RateLimit-Global', '').lower() == 'true'
+                self._limiter.penalize(retry_after, guild_id=thread.guild.id, is_global=is_global)
+
+    async def unarchive_thread(self, guild_id: int, thread: Thread) -> bool:
+        """
+        Unarchive a thread if not excluded from monitoring.
+        Returns whether the thread was unarchived.
+        """
+        # Nothing to do for threads that are already open
+        if not thread.archived:
+            return False
+
         # Check if guild is monitored
-        if guild_id not in self._bot.api.get_thread_managed_guilds():
+        if guild_id not in await self._bot.api.get_thread_managed_guilds():
             # Guild is not monitored. Do nothing.
-            return
+            return False
+
+        if thread.id in await self._bot.api.get_excluded_threads(guild_id):
+            return False
 
-        if thread.id not in self._bot.api.get_excluded_threads(guild_id) and thread.archived:
-            await thread.edit(archived=False)
+        thread = await self.edit_thread(thread, archived=False)
+        self.schedule_thread(thread)
+        return True
 
-    async def unarchive_threads_guild(self, guild: Guild):
+    async def unarchive_threads_guild(self, guild: Guild) -> SweepReport:
         """
         Unarchive all non-excluded threads in a guild
         """
-        for thread in guild.threads:
-            await self.unarchive_thread(guild.id, thread)
+        start = monotonic()
+        report = SweepReport(scanned=len(guild.threads))
+
+        # Only archived threads in managed guilds need any I/O
+        archived = []
+        if guild.id in await self._bot.api.get_thread_managed_guilds():
+            for thread in guild.threads:
+                if thread.archived:
+                    archived.append(thread)
+                else:
+                    self.schedule_thread(thread)
+            if archived:
+                excluded = await self._bot.api.get_excluded_threads(guild.id)
+                archived = [thread for thread in archived if thread.id not in excluded]
+        report.skipped = report.scanned - len(archived)
+
+        # Unarchive threads concurrently, paced by the rate limiter
+        semaphore = Semaphore(self._thread_concurrency)
+        async def unarchive(thread: Thread):
+            async with semaphore:
+                self.schedule_thread(await self.edit_thread(thread, archived=False))
+        results = await gather(*[unarchive(thread) for thread in archived], return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                report.errors += 1
+                if self._bot.debug:
+                    print(f'[DEBUG] Error unarchiving thread in guild {guild.id}: {result}')
+            else:
+                report.unarchived += 1
+
+        report.elapsed = monotonic() - start
+        metrics.observe('thread_sweep_duration_seconds', report.elapsed, scope='guild')
+        metrics.inc('thread_sweep_unarchived_total', report.unarchived)
+        metrics.inc('thread_sweep_errors_total', report.errors)
+        return report
+
+    async def unarchive_threads_guilds(self, guilds: Iterable[Guild]) -> SweepReport:
+        """
+        Unarchive all non-excluded threads in all managed guilds, several guilds at a time
+        """
+        start = monotonic()
+        report = SweepReport()
+        managed_guilds = await self._bot.api.get_thread_managed_guilds()
+
+        semaphore = Semaphore(self._guild_concurrency)
+        async def sweep(guild: Guild) -> SweepReport:
+            async with semaphore:
+                return await self.unarchive_threads_guild(guild)
+        results = await gather(*[sweep(guild) for guild in guilds if guild.id in managed_guilds], return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                report.errors += 1
+                if self._bot.debug:
+                    print(f'[DEBUG] Error sweeping guild: {result}')
+            else:
+                report.merge(result)
+
+        report.elapsed = monotonic() - start
+        metrics.observe('thread_sweep_duration_seconds', report.elapsed, scope='all')
+        return report
     
+    def schedule_thread(self, thread: Thread):
+        """
+        Track the archive deadline of an open thread
+        """
+        if not thread.archived:
+            self._scheduler.track(thread.id, thread.guild.id, archive_deadline(thread))
+
+    async def on_archive_deadline(self, thread_id: int, guild_id: int):
+        """
+        Called by the scheduler once a thread's archive deadline has passed
+        """
+        guild = self._bot.get_guild(guild_id)
+        if guild is None or guild.id not in await self._bot.api.get_thread_managed_guilds():
+            return
+        thread = guild.get_thread(thread_id)
+        if thread is None:
+            return
+
+        # We might have missed the archive event, so check with Discord
+        if not thread.archived:
+            thread = await self._bot.fetch_channel(thread_id)
+
+        if thread.archived:
+            await self.unarchive_thread(guild_id, thread)
+        else:
+            # Still open, so there was activity we didn't see. Check again later.
+            self._scheduler.track(thread.id, guild_id, max(archive_deadline(thread), time() + 60))
+
+    @Cog.listener()
+    async def on_thread_create(self, thread: Thread):
+        """
+        Track new threads in managed guilds
+        """
+        if thread.guild.id in await self._bot.api.get_thread_managed_guilds():
+            self.schedule_thread(thread)
+
+    @Cog.listener()
+    async def on_message(self, message: Message):
+        """
+        Push back the archive deadline of a tracked thread whenever someone posts in it
+        """
+        thread = message.channel
+        if isinstance(thread, Thread) and thread.id in self._scheduler:
+            deadline = message.created_at.timestamp() + thread.auto_archive_duration * 60
+            self._scheduler.track(thread.id, thread.guild.id, deadline)
+
     @Cog.listener()
     async def on_thread_delete(self, thread: Thread):
         """
         Remove deleted thread from DB
         """
-        if thread.id in self._bot.api.get_excluded_threads(thread.guild.id):
-            self._bot.api.remove_excluded_thread(thread.guild.id, thread.id)
+        self._scheduler.untrack(thread.id)
+        if thread.id in await self._bot.api.get_excluded_threads(thread.guild.id):
+            await self._bot.api.remove_excluded_thread(thread.guild.id, thread.id)
 
     @Cog.listener()
     async def on_thread_update(self, before: Thread, after: Thread):
@@ -87,6 +277,10 @@ class ThreadsCog(Cog):
                 print(f'[DEBUG] Unarchiving thread {after.id} in guild {after.guild.id}')
             return await self.unarchive_thread(after.guild.id, after)
 
+        # Thread was unarchived, or its archive duration changed
+        if not after.archived and after.guild.id in await self._bot.api.get_thread_managed_guilds():
+            self.schedule_thread(after)
+
     @slash_command(name='managethread', guild_ids=get_debug_guilds())
     @application_checks.check(is_in_thread)
     @application_checks.has_guild_permissions(administrator=True)
@@ -97,20 +291,20 @@ class ThreadsCog(Cog):
         await itx.response.defer()
 
         # Check if we're monitoring this guild
-        if not self._bot.api.get_thread_manage_status(itx.guild_id):
+        if not await self._bot.api.get_thread_manage_status(itx.guild_id):
             return await itx.followup.send(embed=create_error_embed(
                 title='Can\'t use this command',
                 body='Threads aren\'t being managed in this server. Enable with `/enablemanage`.'
             ))
 
         # Check if thread is not in excluded list
-        if not self._bot.api.check_excluded_thread(itx.guild_id, itx.channel_id):
+        if not await self._bot.api.check_excluded_thread(itx.guild_id, itx.channel_id):
             return await itx.followup.send(embed=create_error_embed(
                 body=f'Thread **{itx.channel.name}** is already being managed.'
             ))
 
         # Remove from excluded list
-        self._bot.api.remove_excluded_thread(itx.guild_id, itx.channel_id)
+        await self._bot.api.remove_excluded_thread(itx.guild_id, itx.channel_id)
         return await itx.followup.send(embed=create_success_embed(
             body=f'Thread **{itx.channel.name}** is now being managed.'
         ))
@@ -125,20 +319,20 @@ class ThreadsCog(Cog):
         await itx.response.defer()
 
         # Check if we're monitoring this guild
-        if not self._bot.api.get_thread_manage_status(itx.guild_id):
+        if not await self._bot.api.get_thread_manage_status(itx.guild_id):
             return await itx.followup.send(embed=create_error_embed(
                 title='Can\'t use this command',
                 body='Threads aren\'t being managed in this server. Enable with `/enablemanage`.'
             ))
 
         # Check if thread is not excluded
-        if self._bot.api.check_excluded_thread(itx.guild_id, itx.channel_id):
+        if await self._bot.api.check_excluded_thread(itx.guild_id, itx.channel_id):
             return await itx.followup.send(embed=create_error_embed(
                 body=f'Thread **{itx.channel.name}** is not being managed.'
             ))
 
         # Add to excluded list
-        self._bot.api.add_excluded_thread(itx.guild_id, itx.channel_id)
+        await self._bot.api.add_excluded_thread(itx.guild_id, itx.channel_id)
 
         # Offer the user the option to archive the thread now
         archive_duration = min_to_dh(itx.channel.auto_archive_duration)
@@ -171,7 +365,7 @@ class ThreadsCog(Cog):
             await message.clear_reactions()
             await message.edit(embed=embed)
             if archive_now:
-                await itx.channel.edit(archived=True)
+                await self.edit_thread(itx.channel, archived=True)
 
     @slash_command(name='enablemanage', guild_ids=get_debug_guilds())
     @application_checks.has_guild_permissions(administrator=True)
@@ -182,14 +376,14 @@ class ThreadsCog(Cog):
         await itx.response.defer()
 
         # Check monitoring status
-        if self._bot.api.get_thread_manage_status(itx.guild_id):
+        if await self._bot.api.get_thread_manage_status(itx.guild_id):
             # Already monitoring guild
             return await itx.followup.send(embed=create_error_embed(
                 body=f'Thread management is already enabled for **{itx.guild.name}**'
             ))
 
         # Enable thread management
-        self._bot.api.set_thread_manage_status(itx.guild_id, True)
+        await self._bot.api.set_thread_manage_status(itx.guild_id, True)
         await itx.followup.send(embed=create_success_embed(
             body=f'Thread management enabled for **{itx.guild.name}**\nInactive threads will be kept unarchived.'
         ))
@@ -206,14 +400,15 @@ class ThreadsCog(Cog):
         await itx.response.defer()
 
         # Check monitoring status
-        if not self._bot.api.get_thread_manage_status(itx.guild_id):
+        if not await self._bot.api.get_thread_manage_status(itx.guild_id):
             # Already monitoring guild
             return await itx.followup.send(embed=create_error_embed(
                 body=f'Thread management is already disabled for **{itx.guild.name}**'
             ))
 
         # Enable thread management
-        self._bot.api.set_thread_manage_status(itx.guild_id, False)
+        await self._bot.api.set_thread_manage_status(itx.guild_id, False)
+        self._scheduler.untrack_guild(itx.guild_id)
         await itx.followup.send(embed=create_success_embed(
             body=f'Thread management disabled for **{itx.guild.name}**\nInactive threads will be auto-archived.'
         ))
@@ -226,11 +421,12 @@ class ThreadsCog(Cog):
         """
         await itx.response.defer(ephemeral=True)
 
-        for guild in self._bot.guilds:
-            await self.unarchive_threads_guild(guild)
-
+        report = await self.unarchive_threads_guilds(self._bot.guilds)
         return await itx.followup.send(embed=create_success_embed(
-            body='Unarchived all managed threads in all monitored servers'
+            body='\n'.join([
+                'Unarchived all managed threads in all monitored servers',
+                format_sweep_report(report)
+            ])
         ))
 
     @slash_command(name='unarchiveall', guild_ids=get_debug_guilds())
@@ -240,11 +436,16 @@ class ThreadsCog(Cog):
         Unarchive all unexcluded threads in this guild
         """
         await itx.response.defer(ephemeral=True)
-        if not self._bot.api.get_thread_manage_status(itx.guild_id):
+        if not await self._bot.api.get_thread_manage_status(itx.guild_id):
             return await itx.followup.send(embed=create_error_embed(
                 title='Can\'t use this command',
                 body='Threads aren\'t being managed in this server. Enable with `/enablemanage`.'
             ))
 
-        await self.unarchive_threads_guild(itx.guild)
-        return await itx.followup.send(embed=create_success_embed(body='Unarchived all managed threads in this server'))
+        report = await self.unarchive_threads_guild(itx.guild)
+        return await itx.followup.send(embed=create_success_embed(
+            body='\n'.join([
+                'Unarchived all managed threads in this server',
+                format_sweep_report(report)
+            ])
+        ))
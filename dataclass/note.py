@@ -1,5 +1,6 @@
 from dataclasses import dataclass
 from datetime import datetime
+from typing import List
 from util.enums import NoteType
 
 
@@ -12,3 +13,10 @@ class Note:
     type: NoteType
     title: str
     url: str
+
+
+@dataclass
+class NotePage:
+    notes: List[Note]
+    total: int
+    offset: int
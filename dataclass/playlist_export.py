@@ -0,0 +1,20 @@
+from dataclasses import dataclass, field
+from typing import List
+from dataclass.spotify_auth import SpotifyCredentials
+
+
+@dataclass
+class ChunkTiming:
+    index: int
+    tracks: int
+    elapsed: float
+
+
+@dataclass
+class PlaylistExport:
+    credentials: SpotifyCredentials
+    playlist_name: str
+    playlist_id: str
+    tracks_added: int = 0
+    chunk_timings: List[ChunkTiming] = field(default_factory=list)
+    elapsed: float = 0.0
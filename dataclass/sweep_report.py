@@ -0,0 +1,16 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class SweepReport:
+    scanned: int = 0
+    unarchived: int = 0
+    skipped: int = 0
+    errors: int = 0
+    elapsed: float = 0.0
+
+    def merge(self, other: 'SweepReport'):
+        self.scanned += other.scanned
+        self.unarchived += other.unarchived
+        self.skipped += other.skipped
+        self.errors += other.errors
@@ -1,21 +1,82 @@
-from dataclass.note import Note
-from requests import JSONDecodeError
-from requests.auth import HTTPBasicAuth
-from typing import Any, Dict, List, Optional
-from util.config import get_debug_status
+from aiohttp import BasicAuth, ClientError, ClientSession, ClientTimeout, TCPConnector
+from asyncio import create_task, FIRST_COMPLETED, gather, Semaphore, shield, sleep, Task, TimeoutError, wait
+from dataclass.note import Note, NotePage
+from dataclass.spotify_auth import SpotifyCredentials
+from datetime import datetime
+from json import dumps
+from time import perf_counter
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+from util.config import Config
+from .cache import TTLCache
+from .enums import NoteType
+from .exceptions import APIError, BackendUnavailableError
+from .list_util import list_chunks
+from .metrics import metrics
+from .note_cache import NoteCache
 from .note_parser import create_note_from_db
-import requests
+from .resilience import CircuitBreaker, jittered_backoff
+
+
+# Requests that can safely be sent more than once
+IDEMPOTENT_VERBS = frozenset(['GET', 'PUT', 'DELETE'])
+
+# Responses worth retrying, because the backend or something in front of it is struggling
+RETRYABLE_STATUSES = frozenset([500, 502, 503, 504])
+
+# Hot reads that may be hedged
+HEDGED_ENDPOINTS = ('/notes', '/excluded_threads', '/excluded_threads/guilds', '/guilds')
+
+
+def build_note_filters(note_type: Optional[NoteType] = None, sender: Optional[int] = None,
+                       since: Optional[datetime] = None, until: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Build the note query filters to send to the backend
+    """
+    filters = {}
+    if note_type is not None:
+        filters['type'] = note_type.value
+    if sender is not None:
+        filters['sender'] = sender
+    if since is not None:
+        filters['since'] = since.timestamp()
+    if until is not None:
+        filters['until'] = until.timestamp()
+    return filters
+
+
+def note_matches_filters(note: Note, filters: Dict[str, Any]) -> bool:
+    """
+    Check a note against query filters, in case the backend ignored them
+    """
+    if 'type' in filters and note.type.value != filters['type']:
+        return False
+    if 'sender' in filters and note.sender != filters['sender']:
+        return False
+    if 'since' in filters and note.timestamp.timestamp() < filters['since']:
+        return False
+    if 'until' in filters and note.timestamp.timestamp() > filters['until']:
+        return False
+    return True
+
+
+def is_backend_unavailable(error: Exception) -> bool:
+    """
+    Check whether a request failed because the backend is down or struggling, rather than because it was rejected
+    """
+    if isinstance(error, APIError):
+        return error.status in RETRYABLE_STATUSES
+    return isinstance(error, BackendUnavailableError)
 
 
 class APIClient:
-    def __init__(self, config: Dict[str, Any]):
-        self._debug = get_debug_status()
+    def __init__(self, config: Config):
+        self._debug = config.debug
 
         try:
             # Build auth header
             auth_username = config['backend']['auth']['username']
             auth_password = config['backend']['auth']['password']
-            self._auth = HTTPBasicAuth(auth_username, auth_password)
+            self._auth = BasicAuth(auth_username, auth_password)
 
             # Get API base URL
             api_host = config['backend']['host']
@@ -25,89 +86,321 @@ class APIClient:
         except KeyError as e:
             raise RuntimeError(f'Missing required config for API: {e}')
 
-        # Create API session
-        self._sesh = requests.Session()
-        self._sesh.verify = False
+        # Connection pool settings
+        pool_config = config['backend'].get('pool', {})
+        self._pool_limit = pool_config.get('limit', 100)
+        self._pool_limit_per_host = pool_config.get('limit_per_host', 20)
+        self._keepalive_timeout = pool_config.get('keepalive_timeout', 30)
+
+        # Request timeouts, in seconds
+        timeout_config = config['backend'].get('timeout', {})
+        self._timeout = ClientTimeout(
+            total=timeout_config.get('total', 10),
+            connect=timeout_config.get('connect', 3)
+        )
+        self._endpoint_timeouts: Dict[str, ClientTimeout] = {
+            endpoint: ClientTimeout(total=total, connect=timeout_config.get('connect', 3))
+            for endpoint, total in timeout_config.get('endpoints', {}).items()
+        }
+
+        # Retries for idempotent requests, with jittered exponential backoff
+        retry_config = config['backend'].get('retry', {})
+        self._retry_attempts = max(1, retry_config.get('attempts', 3))
+        self._retry_base_delay = retry_config.get('base_delay', 0.1)
+        self._retry_max_delay = retry_config.get('max_delay', 2)
+
+        # Hedged reads: if a hot read hasn't answered after `delay` seconds, send it again and take the first answer
+        hedge_config = config['backend'].get('hedge', {})
+        self._hedge_delay: Optional[float] = None
+        if hedge_config.get('enabled', False):
+            self._hedge_delay = hedge_config.get('delay', 0.1)
+        self._hedge_endpoints = frozenset(hedge_config.get('endpoints', HEDGED_ENDPOINTS))
+
+        # Fail fast while the backend is down, serving stale cached data where there is any
+        breaker_config = config['backend'].get('circuit_breaker', {})
+        self._breaker = CircuitBreaker(
+            'API',
+            failure_threshold=breaker_config.get('failure_threshold', 5),
+            reset_timeout=breaker_config.get('reset_timeout', 30)
+        )
+
+        # Cache for thread management state, which rarely changes
+        cache_config = config['backend'].get('cache', {})
+        self._thread_cache = TTLCache(
+            max_size=cache_config.get('max_size', 1024),
+            ttl=cache_config.get('ttl', 300)
+        )
+
+        # Cache for note lists, kept in sync by this client's writes
+        note_cache_config = config['backend'].get('note_cache', {})
+        self._note_cache = NoteCache(
+            max_notes=note_cache_config.get('max_notes', 50000),
+            ttl=note_cache_config.get('ttl', 300)
+        )
 
-    def _call(self, endpoint: str, verb: Optional[str] = 'GET', data: Optional[Dict[str, Any]] = None) -> Any:
+        # Bulk operations
+        self._bulk_concurrency = config['backend'].get('bulk_concurrency', 8)
+
+        # Optional backend features, which must be turned on explicitly
+        capabilities = config['backend'].get('capabilities', {})
+        self._bulk_add_supported = capabilities.get('bulk_add_notes', False)
+        self._bulk_delete_supported = capabilities.get('bulk_delete_notes', False)
+
+        # GETs in flight, keyed by endpoint and payload, so identical concurrent reads share one request
+        self._inflight: Dict[Tuple[str, str], Task] = {}
+
+        # API session is created on first use, since it has to be bound to the running event loop
+        self._sesh: Optional[ClientSession] = None
+
+    def _get_session(self) -> ClientSession:
+        """
+        Get the shared keep-alive API session, creating it if necessary
+        """
+        if self._sesh is None or self._sesh.closed:
+            connector = TCPConnector(
+                limit=self._pool_limit,
+                limit_per_host=self._pool_limit_per_host,
+                keepalive_timeout=self._keepalive_timeout,
+                ssl=False
+            )
+            self._sesh = ClientSession(connector=connector, auth=self._auth, timeout=self._timeout)
+        return self._sesh
+
+    async def close(self):
         """
-        Use session to make request to API endpoint
+        Close the API session and all pooled connections
+        """
+        for task in list(self._inflight.values()):
+            task.cancel()
+        if self._sesh is not None and not self._sesh.closed:
+            await self._sesh.close()
+
+    @property
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            'threads': self._thread_cache.stats,
+            'notes': self._note_cache.stats
+        }
+
+    async def _call(self, endpoint: str, verb: Optional[str] = 'GET', data: Optional[Dict[str, Any]] = None) -> Any:
+        """
+        Use session to make request to API endpoint.
+        Concurrent identical GETs share one request and its result.
+        """
+        if verb != 'GET':
+            try:
+                return await self._send(endpoint, verb, data)
+            finally:
+                # Reads already in flight may have started before this write, so don't let later reads join them
+                self._inflight.clear()
+
+        key = (endpoint, dumps(data, sort_keys=True))
+        task = self._inflight.get(key)
+        if task is None:
+            task = create_task(self._send(endpoint, verb, data))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish_inflight(key, done))
+        else:
+            metrics.inc('backend_coalesced_requests_total', endpoint=endpoint)
+
+        # Shielded, so one caller giving up doesn't cancel the request for everyone else sharing it
+        return await shield(task)
+
+    def _finish_inflight(self, key: Tuple[str, str], task: Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark the error as retrieved, in case every caller gave up waiting
+            task.exception()
+
+    async def _send(self, endpoint: str, verb: str, data: Optional[Dict[str, Any]]) -> Any:
+        """
+        Send a request to an API endpoint.
+        Idempotent requests are retried with jittered backoff after timeouts, connection errors and 5xx responses,
+        and hot reads are hedged if enabled. Fails fast with BackendUnavailableError while the circuit breaker is open.
         """
         url = f'{self._base_url}{endpoint}'
+        if not self._breaker.allow():
+            metrics.inc('backend_rejected_total', endpoint=endpoint, verb=verb)
+            raise BackendUnavailableError(f'{verb} {url}: Too many recent failures')
+
+        attempts = self._retry_attempts if verb in IDEMPOTENT_VERBS else 1
+        hedge = self._hedge_delay is not None and verb == 'GET' and endpoint in self._hedge_endpoints
+        timeout = self._endpoint_timeouts.get(endpoint, self._timeout)
+        for attempt in range(attempts):
+            if attempt > 0:
+                await sleep(jittered_backoff(attempt - 1, self._retry_base_delay, self._retry_max_delay))
+                if not self._breaker.allow():
+                    break
+                metrics.inc('backend_retries_total', endpoint=endpoint, verb=verb)
+
+            try:
+                if hedge:
+                    status, body = await self._hedged_request(endpoint, verb, url, data, timeout)
+                else:
+                    status, body = await self._request(endpoint, verb, url, data, timeout)
+            except TimeoutError:
+                error = BackendUnavailableError(f'{verb} {url}: Timed out')
+            except ClientError as e:
+                error = BackendUnavailableError(f'{verb} {url}: {e}')
+            else:
+                if status not in RETRYABLE_STATUSES:
+                    self._breaker.record_success()
+                    if status != 200:
+                        raise APIError(verb, url, status, body)
+                    return body
+                error = APIError(verb, url, status, body)
+
+        # Count the request as one failure, however many attempts it took
+        self._breaker.record_failure()
+        raise error
+
+    async def _request(self, endpoint: str, verb: str, url: str, data: Optional[Dict[str, Any]],
+                       timeout: ClientTimeout) -> Tuple[int, Any]:
+        """
+        Make a single request, returning the response status and decoded body
+        """
+        status = 'error'
+        start = perf_counter()
         try:
-            response = self._sesh.request(
-                method=verb,
-                url=url,
-                auth=self._auth,
-                json=data
-            )
+            async with self._get_session().request(method=verb, url=url, json=data, timeout=timeout) as response:
+                status = response.status
+                # Pretty print
+                if self._debug:
+                    req = response.request_info
+                    print('{}\n{}\r\n{}\r\n\r\n{}'.format(
+                        '-----------START-----------',
+                        req.method + ' ' + str(req.url),
+                        '\r\n'.join('{}: {}'.format(k, v) for k, v in req.headers.items()),
+                        dumps(data),
+                    ))
 
-            # Pretty print
-            if self._debug:
-                req = response.request
-                print('{}\n{}\r\n{}\r\n\r\n{}'.format(
-                    '-----------START-----------',
-                    req.method + ' ' + req.url,
-                    '\r\n'.join('{}: {}'.format(k, v) for k, v in req.headers.items()),
-                    req.body,
-                ))
-
-            body = response.json()
-            if response.status_code != 200:
-                raise RuntimeError(f'{verb} {url} {response.status_code}: `{body}`')
-        except JSONDecodeError as e:
-            raise RuntimeError(f'{verb} {url}: Error decoding JSON ({e})\'')
-
-        return body
-    
-    def update_guild(self, guild_id: int, guild_name: Optional[str] = None, manage_threads: Optional[bool] = None):
+                try:
+                    body = await response.json(content_type=None)
+                except ValueError as e:
+                    if status not in RETRYABLE_STATUSES:
+                        raise RuntimeError(f'{verb} {url}: Error decoding JSON ({e})\'')
+                    # Probably an error page from a proxy in front of the backend
+                    body = None
+                return status, body
+        finally:
+            metrics.observe('backend_request_duration_seconds', perf_counter() - start,
+                            endpoint=endpoint, verb=verb, status=status)
+
+    async def _hedged_request(self, endpoint: str, verb: str, url: str, data: Optional[Dict[str, Any]],
+                              timeout: ClientTimeout) -> Tuple[int, Any]:
+        """
+        Make a request, sending a second copy if the first hasn't answered within the hedge delay,
+        and return whichever answers first
+        """
+        pending: Set[Task] = {create_task(self._request(endpoint, verb, url, data, timeout))}
+        try:
+            done, pending = await wait(pending, timeout=self._hedge_delay)
+            if not done:
+                metrics.inc('backend_hedged_requests_total', endpoint=endpoint)
+                pending.add(create_task(self._request(endpoint, verb, url, data, timeout)))
+
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                if not pending:
+                    # Both copies failed
+                    return next(iter(done)).result()
+                done, pending = await wait(pending, return_when=FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def update_guild(self, guild_id: int, guild_name: Optional[str] = None, manage_threads: Optional[bool] = None):
         """
-        Update existing guild record, or create a new one if it doesn't exist
+        Update existing guild record, or create a new one if it doesn't exist.
+        The backend's response to a PUT for an unknown guild isn't pinned down, so like before,
+        any client error (4xx) is taken to mean the guild doesn't exist yet.
+        Server errors that outlast the retries are raised instead of creating a guild that likely exists.
         """
         try:
-            self._call('/guilds', verb='PUT', data={
+            await self._call('/guilds', verb='PUT', data={
                 'id': guild_id,
                 'name': guild_name
             })
-        except RuntimeError:
+        except APIError as e:
+            if not 400 <= e.status < 500:
+                raise
             # Guild does not exist yet, create it
-            self._call('/guilds', verb='POST', data={
+            await self._call('/guilds', verb='POST', data={
                 'id': guild_id,
                 'name': guild_name,
                 'manage_threads': False
             })
 
-    def delete_guild(self, guild_id: int):
+    async def delete_guild(self, guild_id: int):
         """
         Delete guild record from DB
         """
-        self._call('/guilds', verb='DELETE', data={
+        await self._call('/guilds', verb='DELETE', data={
             'id': guild_id
         })
+        self._thread_cache.invalidate('managed_guilds')
+        self._thread_cache.invalidate(('excluded_threads', guild_id))
     
-    def update_user(self, user_id: int, username: str, discriminator: str):
+    async def update_user(self, user_id: int, username: str, discriminator: str):
         """
         Insert new user record, or update existing record if user already exists
         """
-        self._call('/users', verb='PUT', data={
+        await self._call('/users', verb='PUT', data={
             'id': user_id,
             'name': username,
             'discriminator': discriminator
         })
 
-    def delete_user(self, user_id: int):
+    async def delete_user(self, user_id: int):
         """
         Delete user record from DB
         """
-        self._call('/users', verb='DELETE', data={
+        await self._call('/users', verb='DELETE', data={
             'id': user_id
         })
     
-    def add_user_note(self, user_id: int, note: Note):
+    async def get_spotify_credentials(self, user_id: int) -> Optional[SpotifyCredentials]:
+        """
+        Get the Spotify credentials a user saved with /spotifylogin, or None if they haven't logged in.
+        See "Backend contract for Spotify exports" in the README for the endpoint's request and response.
+        """
+        try:
+            response = await self._call('/spotify_auth', data={
+                'user_id': user_id
+            })
+        except APIError as e:
+            if e.status == 404:
+                return None
+            raise
+
+        credentials = response['credentials']
+        return SpotifyCredentials(
+            user_id=user_id,
+            refresh_token=credentials['refresh_token'],
+            access_token=credentials['access_token'],
+            expires_at=datetime.fromtimestamp(credentials['expires_at'])
+        )
+
+    async def set_spotify_credentials(self, credentials: SpotifyCredentials):
+        """
+        Save a user's Spotify credentials, e.g. after the access token was renewed.
+        See "Backend contract for Spotify exports" in the README for the endpoint's request and response.
+        """
+        await self._call('/spotify_auth', verb='PUT', data={
+            'user_id': credentials.user_id,
+            'refresh_token': credentials.refresh_token,
+            'access_token': credentials.access_token,
+            'expires_at': credentials.expires_at.timestamp()
+        })
+
+    async def add_user_note(self, user_id: int, note: Note):
         """
         Add note to user notes table in DB
         """
-        self._call('/notes', verb='POST', data={
+        await self._call('/notes', verb='POST', data={
             'for_guild': False,
             'sender': note.sender,
             'recipient': user_id,
@@ -115,42 +408,68 @@ class APIClient:
             'title': note.title,
             'url': note.url
         })
+        self._note_cache.invalidate((False, user_id))
 
-    def get_user_notes(self, user_id: int) -> List[Note]:
+    async def add_user_notes(self, user_id: int, notes: List[Note],
+                             progress: Optional[Callable[[int], Awaitable[None]]] = None) -> List[Note]:
         """
-        Get all notes for a user
+        Add many notes to user notes table in DB
+
+        :return: notes that could not be added
         """
-        notes = self._call('/notes', data={
-            'for_guild': False,
-            'owner': user_id
-        })
-        return [create_note_from_db(note) for note in notes]
+        return await self._add_notes(False, user_id, notes, progress)
+
+    async def get_user_notes(self, user_id: int, **filters) -> List[Note]:
+        """
+        Get all notes for a user, optionally filtered by note_type, sender, since, and until
+        """
+        return await self._get_notes(False, user_id, build_note_filters(**filters))
+
+    def iter_user_notes(self, user_id: int, page_size: int = 100, **filters) -> AsyncIterator[Note]:
+        """
+        Stream notes for a user a page at a time, optionally filtered by note_type, sender, since, and until
+        """
+        return self._iter_notes(False, user_id, build_note_filters(**filters), page_size)
+
+    async def get_user_notes_page(self, user_id: int, offset: int, limit: int) -> NotePage:
+        """
+        Get one page of notes for a user, along with the total number of notes
+        """
+        return await self._get_notes_page(False, user_id, offset, limit)
     
-    def remove_user_note(self, user_id: int, note_id: str):
+    async def remove_user_note(self, user_id: int, note_id: str):
         """
         Remove note from user notes table in DB
         """
-        self._call('/notes', verb='DELETE', data={
+        await self._call('/notes', verb='DELETE', data={
             'for_guild': False,
             'owner': user_id,
             'id': note_id
         })
+        self._note_cache.remove((False, user_id), [note_id])
+    
+    async def remove_user_notes(self, user_id: int, note_ids: Iterable[str]):
+        """
+        Remove many notes from user notes table in DB
+        """
+        await self._remove_notes(False, user_id, note_ids)
     
-    def clear_user_notes(self, user_id: int):
+    async def clear_user_notes(self, user_id: int):
         """
         Remove all notes for a user
         """
-        self._call('/notes', verb='DELETE', data={
+        await self._call('/notes', verb='DELETE', data={
             'for_guild': False,
             'owner': user_id,
             'delete_all': True
         })
+        self._note_cache.clear((False, user_id))
 
-    def add_guild_note(self, guild_id: int, note: Note):
+    async def add_guild_note(self, guild_id: int, note: Note):
         """
         Add note to guild notes table in DB
         """
-        self._call('/notes', verb='POST', data={
+        await self._call('/notes', verb='POST', data={
            'for_guild': True,
            'sender': note.sender,
            'recipient': guild_id,
@@ -158,91 +477,330 @@ class APIClient:
            'title': note.title,
            'url': note.url
        })
+        self._note_cache.invalidate((True, guild_id))
+
+    async def add_guild_notes(self, guild_id: int, notes: List[Note],
+                              progress: Optional[Callable[[int], Awaitable[None]]] = None) -> List[Note]:
+        """
+        Add many notes to guild notes table in DB
+
+        :return: notes that could not be added
+        """
+        return await self._add_notes(True, guild_id, notes, progress)
+
+    async def _add_notes(self, for_guild: bool, owner: int, notes: List[Note],
+                         progress: Optional[Callable[[int], Awaitable[None]]] = None) -> List[Note]:
+        """
+        Add notes in chunks of 100 through the backend's bulk insert if enabled with
+        backend.capabilities.bulk_add_notes, otherwise with concurrent single inserts.
+        `progress` is awaited with the number of notes added so far after each chunk.
+
+        :return: notes that could not be added with single inserts; a failed bulk insert raises instead
+        """
+        semaphore = Semaphore(self._bulk_concurrency)
+        async def add(note: Dict[str, Any]):
+            async with semaphore:
+                await self._call('/notes', verb='POST', data={
+                    'for_guild': for_guild,
+                    'recipient': owner,
+                    **note
+                })
+
+        added = 0
+        failed = []
+        try:
+            for chunk in list_chunks(notes, num_per_chunk=100):
+                chunk = list(chunk)
+                data = [{
+                    'sender': note.sender,
+                    'type': note.type.value,
+                    'title': note.title,
+                    'url': note.url
+                } for note in chunk]
+
+                if self._bulk_add_supported:
+                    await self._call('/notes', verb='POST', data={
+                        'for_guild': for_guild,
+                        'recipient': owner,
+                        'notes': data
+                    })
+                    added += len(chunk)
+                else:
+                    # Let every insert in the chunk finish, and report the ones that failed
+                    results = await gather(*[add(note) for note in data], return_exceptions=True)
+                    for note, result in zip(chunk, results):
+                        if isinstance(result, Exception):
+                            print(f'Could not add note "{note.title}" for {"guild" if for_guild else "user"} {owner}: {result}')
+                            failed.append(note)
+                        else:
+                            added += 1
+
+                if progress is not None:
+                    await progress(added)
+        finally:
+            self._note_cache.invalidate((for_guild, owner))
+        return failed
     
-    def get_guild_notes(self, guild_id: int) -> List[Note]:
+    async def get_guild_notes(self, guild_id: int, **filters) -> List[Note]:
         """
-        Get all notes for a guild
+        Get all notes for a guild, optionally filtered by note_type, sender, since, and until
         """
-        notes = self._call('/notes', data={
-            'for_guild': True,
-            'owner': guild_id
-        })
-        return [create_note_from_db(note) for note in notes]
+        return await self._get_notes(True, guild_id, build_note_filters(**filters))
+
+    def iter_guild_notes(self, guild_id: int, page_size: int = 100, **filters) -> AsyncIterator[Note]:
+        """
+        Stream notes for a guild a page at a time, optionally filtered by note_type, sender, since, and until
+        """
+        return self._iter_notes(True, guild_id, build_note_filters(**filters), page_size)
+
+    async def _get_notes(self, for_guild: bool, owner: int, filters: Dict[str, Any]) -> List[Note]:
+        key = (for_guild, owner)
+        notes = self._note_cache.get_notes(key)
+        if notes is None:
+            # Filtered results are only a subset, so only cache unfiltered fetches
+            version = self._note_cache.version(key)
+            try:
+                response = await self._call('/notes', data={
+                    'for_guild': for_guild,
+                    'owner': owner,
+                    **filters
+                })
+            except RuntimeError as e:
+                notes = self._note_cache.get_notes(key, stale=True)
+                if notes is None or not is_backend_unavailable(e):
+                    raise
+                metrics.inc('backend_stale_reads_total', endpoint='/notes')
+                return [note for note in notes if note_matches_filters(note, filters)]
+
+            if not isinstance(response, list):
+                response = response['notes']
+            notes = [create_note_from_db(note) for note in response]
+            if not filters:
+                self._note_cache.set_notes(key, notes, version)
+        return [note for note in notes if note_matches_filters(note, filters)]
+
+    async def _iter_notes(self, for_guild: bool, owner: int, filters: Dict[str, Any], page_size: int) -> AsyncIterator[Note]:
+        cached = self._note_cache.get_notes((for_guild, owner))
+        if cached is not None:
+            for note in cached:
+                if note_matches_filters(note, filters):
+                    yield note
+            return
+
+        offset = 0
+        while True:
+            response = await self._call('/notes', data={
+                'for_guild': for_guild,
+                'owner': owner,
+                'offset': offset,
+                'limit': page_size,
+                **filters
+            })
+
+            # Backend may return the full list instead of a page
+            total = None
+            if not isinstance(response, list):
+                total = response['total']
+                response = response['notes']
+
+            for row in response:
+                note = create_note_from_db(row)
+                if note_matches_filters(note, filters):
+                    yield note
+
+            offset += len(response)
+            if total is None or not response or offset >= total:
+                return
+
+    async def get_guild_notes_page(self, guild_id: int, offset: int, limit: int) -> NotePage:
+        """
+        Get one page of notes for a guild, along with the total number of notes
+        """
+        return await self._get_notes_page(True, guild_id, offset, limit)
+
+    async def _get_notes_page(self, for_guild: bool, owner: int, offset: int, limit: int) -> NotePage:
+        key = (for_guild, owner)
+        page = self._note_cache.get_page(key, offset, limit)
+        if page is not None:
+            return page
+
+        version = self._note_cache.version(key)
+        try:
+            response = await self._call('/notes', data={
+                'for_guild': for_guild,
+                'owner': owner,
+                'offset': offset,
+                'limit': limit
+            })
+        except RuntimeError as e:
+            page = self._note_cache.get_page(key, offset, limit, stale=True)
+            if page is None or not is_backend_unavailable(e):
+                raise
+            metrics.inc('backend_stale_reads_total', endpoint='/notes')
+            return page
+
+        if isinstance(response, list):
+            # Backend returned the full list, so cache it and paginate here
+            notes = [create_note_from_db(note) for note in response]
+            self._note_cache.set_notes(key, notes, version)
+            return NotePage(notes=notes[offset:offset + limit], total=len(notes), offset=offset)
+
+        page = NotePage(notes=[create_note_from_db(note) for note in response['notes']], total=response['total'], offset=offset)
+        self._note_cache.set_page(key, limit, page, version)
+        return page
     
-    def remove_guild_note(self, guild_id: int, note_id: str):
+    async def remove_guild_note(self, guild_id: int, note_id: str):
         """
         Remove note from guild notes table in DB
         """
-        self._call('/notes', verb='DELETE', data={
+        await self._call('/notes', verb='DELETE', data={
             'for_guild': True,
             'owner': guild_id,
             'id': note_id
         })
+        self._note_cache.remove((True, guild_id), [note_id])
+    
+    async def remove_guild_notes(self, guild_id: int, note_ids: Iterable[str]):
+        """
+        Remove many notes from guild notes table in DB
+        """
+        await self._remove_notes(True, guild_id, note_ids)
+
+    async def _remove_notes(self, for_guild: bool, owner: int, note_ids: Iterable[str]):
+        """
+        Remove notes in chunks of 100 through the backend's bulk delete if enabled with
+        backend.capabilities.bulk_delete_notes, otherwise with concurrent single deletes.
+        Notes that are already gone are ignored, so this is safe to retry.
+        """
+        key = (for_guild, owner)
+        note_ids = list(dict.fromkeys(note_ids))
+        try:
+            await self._delete_notes(for_guild, owner, note_ids)
+        except Exception:
+            # Some of the notes may be gone already
+            self._note_cache.invalidate(key)
+            raise
+        self._note_cache.remove(key, note_ids)
+
+    async def _delete_notes(self, for_guild: bool, owner: int, note_ids: List[str]):
+        if self._bulk_delete_supported:
+            for chunk in list_chunks(note_ids, num_per_chunk=100):
+                await self._call('/notes', verb='DELETE', data={
+                    'for_guild': for_guild,
+                    'owner': owner,
+                    'ids': list(chunk)
+                })
+            return
+
+        semaphore = Semaphore(self._bulk_concurrency)
+        async def remove(note_id: str):
+            async with semaphore:
+                try:
+                    await self._call('/notes', verb='DELETE', data={
+                        'for_guild': for_guild,
+                        'owner': owner,
+                        'id': note_id
+                    })
+                except APIError as e:
+                    if e.status != 404:
+                        raise
+        await gather(*[remove(note_id) for note_id in note_ids])
     
-    def clear_guild_notes(self, guild_id: int):
+    async def clear_guild_notes(self, guild_id: int):
         """
         Remove all notes for a guild
         """
-        self._call('/notes', verb='DELETE', data={
-            'for_guild': False,
+        await self._call('/notes', verb='DELETE', data={
+            'for_guild': True,
             'owner': guild_id,
             'delete_all': True
         })
+        self._note_cache.clear((True, guild_id))
     
-    def add_excluded_thread(self, guild_id: int, thread_id: int):
+    async def add_excluded_thread(self, guild_id: int, thread_id: int):
         """
         Exclude a thread from being archived in a guild
         """
-        self._call('/excluded_threads', verb='POST', data={
+        await self._call('/excluded_threads', verb='POST', data={
             'guild_id': guild_id,
             'thread_id': thread_id
         })
+        self._thread_cache.invalidate(('excluded_threads', guild_id))
 
-    def get_excluded_threads(self, guild_id: int) -> List[int]:
+    async def get_excluded_threads(self, guild_id: int) -> FrozenSet[int]:
         """
         Get all excluded threads for a guild
         """
-        response = self._call('/excluded_threads', data={
-            'guild_id': guild_id
-        })
-        return response['excluded_threads']
+        key = ('excluded_threads', guild_id)
+        excluded = self._thread_cache.get(key)
+        if excluded is None:
+            version = self._thread_cache.version(key)
+            try:
+                response = await self._call('/excluded_threads', data={
+                    'guild_id': guild_id
+                })
+            except RuntimeError as e:
+                excluded = self._thread_cache.get_stale(key)
+                if excluded is None or not is_backend_unavailable(e):
+                    raise
+                metrics.inc('backend_stale_reads_total', endpoint='/excluded_threads')
+                return excluded
+
+            excluded = frozenset(response['excluded_threads'])
+            self._thread_cache.set(key, excluded, version=version)
+        return excluded
 
-    def check_excluded_thread(self, guild_id: int, thread_id: int) -> bool:
+    async def check_excluded_thread(self, guild_id: int, thread_id: int) -> bool:
         """
         Check if a thread is excluded from being archived in a guild
         """
-        return thread_id in self.get_excluded_threads(guild_id)
+        return thread_id in await self.get_excluded_threads(guild_id)
     
-    def remove_excluded_thread(self, guild_id: int, thread_id: int):
+    async def remove_excluded_thread(self, guild_id: int, thread_id: int):
         """
         Remove excluded thread from guild
         """
-        self._call('/excluded_threads', verb='DELETE', data={
+        await self._call('/excluded_threads', verb='DELETE', data={
             'guild_id': guild_id,
             'thread_id': thread_id
         })
+        self._thread_cache.invalidate(('excluded_threads', guild_id))
     
-    def get_thread_manage_status(self, guild_id: int) -> bool:
+    async def get_thread_manage_status(self, guild_id: int) -> bool:
         """
         Check whether threads are being automatically unarchived in a guild
         """
-        response = self._call('/guilds', data={
+        response = await self._call('/guilds', data={
             'id': guild_id
         })
         return response['guild']['manage_threads']
 
-    def set_thread_manage_status(self, guild_id: int, status: bool):
+    async def set_thread_manage_status(self, guild_id: int, status: bool):
         """
         Set whether threads are being automatically unarchived in a guild
         """
-        self._call('/guilds', verb='PUT', data={
+        await self._call('/guilds', verb='PUT', data={
             'id': guild_id,
             'manage_threads': status
         })
+        self._thread_cache.invalidate('managed_guilds')
 
-    def get_thread_managed_guilds(self) -> List[int]:
-        """
-        Return a list of IDs of all guilds whose threads are being managed
-        """
-        response = self._call('/excluded_threads/guilds')
-        return response['guilds']
+    async def get_thread_managed_guilds(self) -> FrozenSet[int]:
+        """
+        Return the IDs of all guilds whose threads are being managed
+        """
+        managed_guilds = self._thread_cache.get('managed_guilds')
+        if managed_guilds is None:
+            version = self._thread_cache.version('managed_guilds')
+            try:
+                response = await self._call('/excluded_threads/guilds')
+            except RuntimeError as e:
+                managed_guilds = self._thread_cache.get_stale('managed_guilds')
+                if managed_guilds is None or not is_backend_unavailable(e):
+                    raise
+                metrics.inc('backend_stale_reads_total', endpoint='/excluded_threads/guilds')
+                return managed_guilds
+
+            managed_guilds = frozenset(response['guilds'])
+            self._thread_cache.set('managed_guilds', managed_guilds, version=version)
+        return managed_guilds
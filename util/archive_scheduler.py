@@ -0,0 +1,92 @@
+from asyncio import Event, TimeoutError, wait_for
+from heapq import heapify, heappop, heappush
+from time import time
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+
+class ArchiveScheduler:
+    """
+    Keeps the archive deadline of every tracked thread in a min-heap,
+    and calls back shortly after each deadline passes so the thread can be checked.
+    Deadlines are Unix timestamps.
+    """
+    def __init__(self, callback: Callable[[int, int], Awaitable[None]], grace: float = 30):
+        self._callback = callback
+        self._grace = grace
+        self._heap: List[Tuple[float, int]] = []
+        self._deadlines: Dict[int, Tuple[float, int]] = {}
+        self._wakeup = Event()
+
+    def __contains__(self, thread_id: int) -> bool:
+        return thread_id in self._deadlines
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def track(self, thread_id: int, guild_id: int, deadline: float):
+        """
+        Track a thread, replacing its previous deadline if any
+        """
+        self._deadlines[thread_id] = (deadline, guild_id)
+        heappush(self._heap, (deadline, thread_id))
+
+        # Wake the runner if this is now the earliest deadline
+        if self._heap[0][1] == thread_id:
+            self._wakeup.set()
+
+        # Drop superseded heap entries once they outnumber live ones
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._compact()
+
+    def untrack(self, thread_id: int):
+        """
+        Stop tracking a thread
+        """
+        self._deadlines.pop(thread_id, None)
+
+    def untrack_guild(self, guild_id: int):
+        """
+        Stop tracking all threads in a guild
+        """
+        for thread_id in [k for k, v in self._deadlines.items() if v[1] == guild_id]:
+            del self._deadlines[thread_id]
+
+    def _compact(self):
+        self._heap = [(deadline, thread_id) for thread_id, (deadline, _) in self._deadlines.items()]
+        heapify(self._heap)
+
+    def _pop_due(self, now: float) -> List[Tuple[int, int]]:
+        """
+        Remove and return (thread ID, guild ID) for every thread whose deadline has passed
+        """
+        due = []
+        while self._heap and self._heap[0][0] + self._grace <= now:
+            deadline, thread_id = heappop(self._heap)
+            entry = self._deadlines.get(thread_id)
+            if entry is None or entry[0] != deadline:
+                # Untracked, or superseded by a later deadline
+                continue
+            del self._deadlines[thread_id]
+            due.append((thread_id, entry[1]))
+        return due
+
+    async def run(self):
+        """
+        Sleep until the next deadline passes, then call back for every due thread. Runs forever.
+        """
+        while True:
+            for thread_id, guild_id in self._pop_due(time()):
+                try:
+                    await self._callback(thread_id, guild_id)
+                except Exception as e:
+                    print(f'Error handling archive deadline for thread {thread_id}: {e}')
+
+            # Sleep until the earliest deadline, or until an earlier one is tracked
+            self._wakeup.clear()
+            timeout = None
+            if self._heap:
+                timeout = max(0.0, self._heap[0][0] + self._grace - time())
+            try:
+                await wait_for(self._wakeup.wait(), timeout=timeout)
+            except TimeoutError:
+                pass
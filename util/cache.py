@@ -0,0 +1,92 @@
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    Bounded in-memory cache whose entries expire after a fixed time-to-live.
+    When full, the least recently used entry is evicted first.
+    Expired entries are kept until evicted or replaced, so they can still be served with get_stale().
+
+    Invalidating a key bumps its version. Fetches can take the version before calling the backend
+    and pass it back when storing, so a fetch that raced with a write never caches what the write replaced.
+    """
+    def __init__(self, max_size: int = 1024, ttl: float = 300):
+        self._data: OrderedDict[Hashable, Tuple[float, Any]] = OrderedDict()
+        self.max_size = max_size
+        self.ttl = ttl
+        self._versions: Dict[Hashable, int] = {}
+        self._clears = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and entry[0] > monotonic()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """
+        Get a value from the cache, or the default if it's missing or expired
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        expires_at, value = entry
+        if expires_at <= monotonic():
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def get_stale(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """
+        Get a value from the cache even if it has expired, e.g. when it can't be refreshed
+        """
+        entry = self._data.get(key)
+        return entry[1] if entry is not None else default
+
+    def version(self, key: Hashable) -> int:
+        # Both counts only go up, so their sum changes whenever the key is invalidated or the cache is cleared
+        return self._versions.get(key, 0) + self._clears
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, version: Optional[int] = None):
+        """
+        Store a value in the cache, evicting the least recently used entry if full.
+        If `version` is given, the value is only stored if the key hasn't been invalidated since.
+        """
+        if version is not None and version != self.version(key):
+            return
+        self._data[key] = (monotonic() + (ttl if ttl is not None else self.ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        """
+        Remove a value from the cache, if present
+        """
+        self._versions[key] = self._versions.get(key, 0) + 1
+        self._data.pop(key, None)
+
+    def clear(self):
+        """
+        Remove all values from the cache
+        """
+        self._clears += 1
+        self._data.clear()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data)
+        }
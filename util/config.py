@@ -1,26 +1,150 @@
-from typing import Any, Dict, List
+from asyncio import AbstractEventLoop, sleep
+from dataclasses import dataclass
+from os import stat
+import signal
+from types import MappingProxyType
+from typing import Any, Mapping, Optional, Tuple
 from yaml import safe_load
 
 
-def get_config() -> Dict[str, Any]:
+CONFIG_PATH = 'config.yml'
+
+
+@dataclass(frozen=True)
+class Config:
+    """
+    Parsed contents of config.yml.
+    Immutable, so one instance can be shared by everything and swapped out whole on reload.
+    """
+    data: Mapping[str, Any]
+    debug: bool
+    debug_guilds: Tuple[int, ...]
+    mtime: float
+
+    def __getitem__(self, key: str) -> Any:
+        return self.data[key]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.data.get(key, default)
+
+
+_config: Optional[Config] = None
+
+
+def _freeze(value: Any) -> Any:
+    """
+    Make parsed YAML read-only, turning dicts into mapping proxies and lists into tuples
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _load_config() -> Config:
     try:
-        with open('config.yml', 'r') as f:
-            return safe_load(f)
+        mtime = stat(CONFIG_PATH).st_mtime
+        with open(CONFIG_PATH, 'r') as f:
+            data = safe_load(f)
     except FileNotFoundError:
-        raise RuntimeError('config.yml not found')
+        raise RuntimeError(f'{CONFIG_PATH} not found')
     except Exception as e:
-        raise RuntimeError(f'Error parsing config.yml: {e}')
+        raise RuntimeError(f'Error parsing {CONFIG_PATH}: {e}')
+    if not isinstance(data, dict):
+        # An empty file parses to None
+        raise RuntimeError(f'Error parsing {CONFIG_PATH}: expected a mapping of settings, got {type(data).__name__}')
+    data = _freeze(data)
 
+    try:
+        debug = bool(data['bot']['debug']['enabled'])
+    except (KeyError, TypeError):
+        debug = False
+    try:
+        debug_guilds = tuple(data['bot']['debug']['guild_ids'])
+    except (KeyError, TypeError):
+        debug_guilds = ()
+    return Config(data=data, debug=debug, debug_guilds=debug_guilds, mtime=mtime)
 
-def get_debug_status() -> bool:
+
+def get_config() -> Config:
+    """
+    Get the current config, loading it on first use
+    """
+    global _config
+    if _config is None:
+        _config = _load_config()
+    return _config
+
+
+def set_config(config: Config):
+    """
+    Use a config that wasn't loaded from config.yml, e.g. for benchmarks
+    """
+    global _config
+    _config = config
+
+
+def reload_config() -> Config:
+    """
+    Re-read config.yml and swap it in.
+    If the file can't be parsed, the current config stays in place.
+    Values that were read at startup, such as slash command guilds and connection settings, are not affected.
+    """
+    global _config
+    _config = _load_config()
+    print(f'Reloaded {CONFIG_PATH}')
+    return _config
+
+
+def reload_config_if_changed() -> bool:
+    """
+    Reload config.yml if it was modified since it was last loaded
+    """
     try:
-        return get_config()['bot']['debug']['enabled']
-    except KeyError:
+        mtime = stat(CONFIG_PATH).st_mtime
+    except OSError:
+        return False
+    if mtime == get_config().mtime:
         return False
+    reload_config()
+    return True
 
 
-def get_debug_guilds() -> List[int]:
+def install_reload_handler(loop: AbstractEventLoop):
+    """
+    Reload config.yml when the process receives SIGHUP
+    """
+    def on_sighup():
+        try:
+            reload_config()
+        except RuntimeError as e:
+            print(f'Error reloading config: {e}')
+    sighup = getattr(signal, 'SIGHUP', None)
+    if sighup is None:
+        return
     try:
-        return get_config()['bot']['debug']['guild_ids']
-    except KeyError:
-        return []
+        loop.add_signal_handler(sighup, on_sighup)
+    except (NotImplementedError, RuntimeError):
+        # Signal handlers are not supported on this platform or loop
+        pass
+
+
+async def watch_config(interval: float):
+    """
+    Reload config.yml whenever it is modified, checking every `interval` seconds
+    """
+    while True:
+        await sleep(interval)
+        try:
+            reload_config_if_changed()
+        except RuntimeError as e:
+            print(f'Error reloading config: {e}')
+
+
+def get_debug_status() -> bool:
+    return get_config().debug
+
+
+def get_debug_guilds() -> Tuple[int, ...]:
+    return get_config().debug_guilds
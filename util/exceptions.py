@@ -1,3 +1,23 @@
+class APIError(RuntimeError):
+    def __init__(self, verb, url, status, body):
+        self.status = status
+        self.message = f'{verb} {url} {status}: `{body}`'
+        super().__init__(self.message)
+
+
+class BackendUnavailableError(RuntimeError):
+    def __init__(self, reason):
+        self.message = f'The backend is unavailable right now, please try again later. ({reason})'
+        super().__init__(self.message)
+
+
+class SpotifyAPIError(Exception):
+    def __init__(self, verb, url, status, body):
+        self.status = status
+        self.message = f'Spotify API error: {verb} {url} {status}: `{body}`'
+        super().__init__(self.message)
+
+
 class SpotifyInsufficientAccessError(Exception):
     def __init__(self):
         self.message = "Insufficient access to Spotify data. Try authenticating again."
@@ -9,6 +29,14 @@ class SpotifyInvalidURLError(Exception):
         super().__init__(self.message)
 
 
+class SpotifyTooManyTracksError(Exception):
+    def __init__(self, total, limit):
+        self.total = total
+        self.limit = limit
+        self.message = f'This list has {total} tracks, more than the {limit} that can be added at a time.'
+        super().__init__(self.message)
+
+
 class SpotifyNotFoundError(Exception):
     def __init__(self, entity_type, entity_id):
         self.message = "No {0} with ID {1} found in Spotify catalog".format(entity_type, entity_id)
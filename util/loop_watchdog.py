@@ -0,0 +1,106 @@
+import sys
+import traceback
+from asyncio import AbstractEventLoop, sleep, Task
+from functools import partial
+from os.path import abspath, dirname, join
+from threading import Event, get_ident, Thread
+from time import monotonic
+from types import FrameType
+from typing import Optional
+from .metrics import metrics
+
+
+COGS_DIR = join(dirname(dirname(abspath(__file__))), 'cogs')
+
+
+def describe_frame(frame: FrameType) -> str:
+    """
+    Name the function running in a frame, with its class if it's a method
+    """
+    owner = frame.f_locals.get('self')
+    if owner is not None:
+        return f'{type(owner).__name__}.{frame.f_code.co_name}'
+    return frame.f_code.co_name
+
+
+def find_blocking_context(frame: FrameType) -> str:
+    """
+    Find the outermost cog method in a stack, i.e. the slash command or listener that is running
+    """
+    context = 'unknown'
+    while frame is not None:
+        if abspath(frame.f_code.co_filename).startswith(COGS_DIR):
+            context = describe_frame(frame)
+        frame = frame.f_back
+    return context
+
+
+class LoopWatchdog:
+    """
+    Measures event loop lag, and reports what the loop is stuck on when a callback blocks it for too long.
+
+    A heartbeat task on the loop records when it last ran. A separate thread checks the heartbeat, and once it is
+    more than `threshold` seconds late, samples the loop thread's stack and names the cog method it is running.
+    """
+    def __init__(self, threshold: float = 0.25, interval: float = 0.05):
+        self._threshold = threshold
+        self._interval = interval
+        self._last_beat = monotonic()
+        self._reported = False
+        self._loop: Optional[AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[Task] = None
+        self._thread: Optional[Thread] = None
+        self._stopped = Event()
+
+    def start(self, loop: AbstractEventLoop):
+        """
+        Start watching a loop. Must be called from the loop's thread.
+        """
+        self._loop = loop
+        self._loop_thread_id = get_ident()
+        self._last_beat = monotonic()
+        self._task = loop.create_task(self._heartbeat(loop))
+        self._thread = Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _heartbeat(self, loop: AbstractEventLoop):
+        while True:
+            expected = loop.time() + self._interval
+            await sleep(self._interval)
+            lag = max(0.0, loop.time() - expected)
+            self._last_beat = monotonic()
+            self._reported = False
+            metrics.observe('event_loop_lag_seconds', lag)
+            if lag > self._threshold:
+                print(f'[WATCHDOG] Event loop was blocked for {lag:.3f}s')
+
+    def _watch(self):
+        while not self._stopped.wait(self._interval):
+            blocked = monotonic() - self._last_beat - self._interval
+            if blocked > self._threshold and not self._reported:
+                self._reported = True
+                self._report(blocked)
+
+    def _report(self, blocked: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+
+        context = find_blocking_context(frame)
+        # The registry isn't thread-safe, so record on the loop, once it's unblocked
+        self._loop.call_soon_threadsafe(partial(metrics.inc, 'event_loop_stalls_total', context=context))
+        stack = traceback.extract_stack(frame)
+
+        # Skip the event loop's own frames, down to the callback it was running
+        start = 0
+        for i, entry in enumerate(stack):
+            if entry.filename.endswith(join('asyncio', 'events.py')):
+                start = i + 1
+        stack = ''.join(traceback.format_list(stack[start:]))
+        print(f'[WATCHDOG] Event loop blocked for over {blocked:.3f}s in {context}, stack sample:\n{stack}', end='')
@@ -0,0 +1,49 @@
+from nextcord import Guild
+from typing import Dict, FrozenSet, Iterable, Set
+
+
+class MemberIndex:
+    """
+    Index of the guilds each user shares with the bot, keyed by user ID.
+    Kept up to date from member and guild events, so lookups don't have to scan every guild.
+    """
+    def __init__(self, guilds: Iterable[Guild] = ()):
+        self._guilds: Dict[int, Set[int]] = {}
+        self._members: Dict[int, Set[int]] = {}
+        for guild in guilds:
+            self.add_guild(guild)
+
+    def __len__(self) -> int:
+        return len(self._guilds)
+
+    def add_guild(self, guild: Guild):
+        for member in guild.members:
+            self.add_member(member.id, guild.id)
+
+    def remove_guild(self, guild: Guild):
+        # Use the indexed members, in case the guild's member cache is already gone
+        for user_id in list(self._members.get(guild.id, ())):
+            self.remove_member(user_id, guild.id)
+
+    def add_member(self, user_id: int, guild_id: int):
+        self._guilds.setdefault(user_id, set()).add(guild_id)
+        self._members.setdefault(guild_id, set()).add(user_id)
+
+    def remove_member(self, user_id: int, guild_id: int):
+        user_ids = self._members.get(guild_id)
+        if user_ids is not None:
+            user_ids.discard(user_id)
+            if not user_ids:
+                del self._members[guild_id]
+
+        guild_ids = self._guilds.get(user_id)
+        if guild_ids is not None:
+            guild_ids.discard(guild_id)
+            if not guild_ids:
+                del self._guilds[user_id]
+
+    def get_guilds(self, user_id: int) -> FrozenSet[int]:
+        """
+        Get the IDs of all guilds a user shares with the bot
+        """
+        return frozenset(self._guilds.get(user_id, ()))
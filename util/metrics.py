@@ -0,0 +1,145 @@
+from aiohttp import web
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# Latency histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    """
+    In-process counters and latency histograms, keyed by metric name and labels.
+    Recording is a dict lookup and an increment; nothing is formatted until metrics are read.
+    Gauges such as cache sizes are collected from registered callbacks only when metrics are read.
+    Not thread-safe: record only from the event loop's thread.
+    """
+    def __init__(self):
+        self.enabled = True
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._collectors: List[Callable[[], Dict[str, Dict[Labels, float]]]] = []
+
+    def inc(self, name: str, value: float = 1, **labels: Any):
+        if not self.enabled:
+            return
+        series = self._counters.setdefault(name, {})
+        key = tuple((k, str(v)) for k, v in labels.items())
+        series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: Any):
+        if not self.enabled:
+            return
+        series = self._histograms.setdefault(name, {})
+        key = tuple((k, str(v)) for k, v in labels.items())
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram()
+        histogram.observe(value)
+
+    def register_collector(self, collector: Callable[[], Dict[str, Dict[Labels, float]]]):
+        """
+        Register a callback that returns gauge values, by metric name and labels, whenever metrics are read
+        """
+        self._collectors.append(collector)
+
+    def _collect_gauges(self) -> Dict[str, Dict[Labels, float]]:
+        gauges = {}
+        for collector in self._collectors:
+            for name, series in collector().items():
+                gauges.setdefault(name, {}).update(series)
+        return gauges
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Get all metrics as a JSON-serializable dict
+        """
+        def series_list(series: Dict[Labels, Any], value: Callable[[Any], Any]) -> List[Dict[str, Any]]:
+            return [{'labels': dict(labels), 'value': value(v)} for labels, v in series.items()]
+
+        return {
+            'counters': {name: series_list(series, lambda v: v) for name, series in self._counters.items()},
+            'gauges': {name: series_list(series, lambda v: v) for name, series in self._collect_gauges().items()},
+            'histograms': {name: series_list(series, lambda h: {
+                'count': h.count,
+                'sum': h.sum,
+                'buckets': dict(zip([*map(str, h.buckets), '+Inf'], h.counts))
+            }) for name, series in self._histograms.items()}
+        }
+
+    def render_prometheus(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format
+        """
+        def format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+            pairs = list(labels) + ([extra] if extra is not None else [])
+            if not pairs:
+                return ''
+            escaped = [(k, v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs]
+            return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+        lines = []
+        for name, series in self._counters.items():
+            lines.append(f'# TYPE {name} counter')
+            lines.extend(f'{name}{format_labels(labels)} {value}' for labels, value in series.items())
+        for name, series in self._collect_gauges().items():
+            lines.append(f'# TYPE {name} gauge')
+            lines.extend(f'{name}{format_labels(labels)} {value}' for labels, value in series.items())
+        for name, series in self._histograms.items():
+            lines.append(f'# TYPE {name} histogram')
+            for labels, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip([*map(str, histogram.buckets), '+Inf'], histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{format_labels(labels, ("le", bound))} {cumulative}')
+                lines.append(f'{name}_sum{format_labels(labels)} {histogram.sum}')
+                lines.append(f'{name}_count{format_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+
+def cache_stats_collector(caches: Callable[[], Dict[str, Dict[str, int]]]) -> Callable[[], Dict[str, Dict[Labels, float]]]:
+    """
+    Turn a callback returning cache stats dicts, by cache name, into a gauge collector
+    """
+    def collect() -> Dict[str, Dict[Labels, float]]:
+        gauges = {'cache_hits': {}, 'cache_misses': {}, 'cache_size': {}}
+        for cache, stats in caches().items():
+            labels = (('cache', cache),)
+            gauges['cache_hits'][labels] = stats['hits']
+            gauges['cache_misses'][labels] = stats['misses']
+            gauges['cache_size'][labels] = stats['size']
+        return gauges
+    return collect
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """
+    Serve metrics in the Prometheus text format at /metrics
+    """
+    async def handle(_: web.Request) -> web.Response:
+        return web.Response(text=metrics.render_prometheus(), content_type='text/plain')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
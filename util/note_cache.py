@@ -0,0 +1,158 @@
+from collections import OrderedDict
+from dataclass.note import Note, NotePage
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+OwnerKey = Tuple[bool, int]
+
+
+@dataclass
+class CachedNotes:
+    expires_at: float
+    notes: Optional[List[Note]] = None
+    pages: Dict[Tuple[int, int], NotePage] = field(default_factory=dict)
+
+    @property
+    def size(self) -> int:
+        return len(self.notes or []) + sum(len(page.notes) for page in self.pages.values())
+
+
+class NoteCache:
+    """
+    Read-through cache of each owner's notes, keyed by (for_guild, owner).
+    Holds an owner's full list and/or individual pages of it, and evicts least recently used owners
+    once the total number of cached notes goes over `max_notes`.
+
+    Every write to an owner's notes bumps that owner's version. Fetches take the version before calling the backend
+    and pass it back when storing, so a fetch that raced with a write never caches what the write replaced.
+    """
+    def __init__(self, max_notes: int = 50000, ttl: float = 300):
+        self._entries: OrderedDict[OwnerKey, CachedNotes] = OrderedDict()
+        self._max_notes = max_notes
+        self._ttl = ttl
+        self._size = 0
+        self._versions: Dict[OwnerKey, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _get_entry(self, key: OwnerKey, stale: bool = False) -> Optional[CachedNotes]:
+        entry = self._entries.get(key)
+        if entry is None or (not stale and entry.expires_at <= monotonic()):
+            # Expired entries are kept for stale reads until evicted or replaced
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _put_entry(self, key: OwnerKey) -> CachedNotes:
+        entry = self._get_entry(key)
+        if entry is None:
+            self._drop(key)
+            entry = CachedNotes(expires_at=monotonic() + self._ttl)
+            self._entries[key] = entry
+        return entry
+
+    def _resize(self, delta: int):
+        self._size += delta
+        while self._size > self._max_notes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= evicted.size
+
+    def version(self, key: OwnerKey) -> int:
+        return self._versions.get(key, 0)
+
+    def get_notes(self, key: OwnerKey, stale: bool = False) -> Optional[List[Note]]:
+        """
+        Get an owner's full note list, or None if it isn't cached.
+        If `stale` is set, an expired list is returned too.
+        """
+        entry = self._get_entry(key, stale)
+        if entry is None or entry.notes is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry.notes
+
+    def set_notes(self, key: OwnerKey, notes: List[Note], version: int):
+        if version != self.version(key):
+            return
+        entry = self._put_entry(key)
+        old_size = entry.size
+        entry.notes = list(notes)
+        entry.pages.clear()
+        self._resize(entry.size - old_size)
+
+    def get_page(self, key: OwnerKey, offset: int, limit: int, stale: bool = False) -> Optional[NotePage]:
+        """
+        Get one page of an owner's notes, from the cached page or full list if available.
+        If `stale` is set, expired pages are returned too.
+        """
+        entry = self._get_entry(key, stale)
+        if entry is not None:
+            if entry.notes is not None:
+                self.hits += 1
+                return NotePage(notes=entry.notes[offset:offset + limit], total=len(entry.notes), offset=offset)
+            if (offset, limit) in entry.pages:
+                self.hits += 1
+                return entry.pages[(offset, limit)]
+        self.misses += 1
+        return None
+
+    def set_page(self, key: OwnerKey, limit: int, page: NotePage, version: int):
+        if version != self.version(key):
+            return
+        entry = self._put_entry(key)
+        if entry.notes is not None:
+            return
+        old_size = entry.size
+        entry.pages[(page.offset, limit)] = page
+        self._resize(entry.size - old_size)
+
+    def remove(self, key: OwnerKey, note_ids: Iterable[str]):
+        """
+        Remove notes from an owner's cached list
+        """
+        self._bump(key)
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        if entry.notes is None:
+            # Removing notes shifts every page after them
+            self._drop(key)
+            return
+
+        note_ids = set(note_ids)
+        old_size = entry.size
+        entry.notes = [note for note in entry.notes if note.id not in note_ids]
+        self._resize(entry.size - old_size)
+
+    def clear(self, key: OwnerKey):
+        """
+        Cache an empty list for an owner whose notes were all removed
+        """
+        self._bump(key)
+        self.set_notes(key, [], self.version(key))
+
+    def invalidate(self, key: OwnerKey):
+        """
+        Drop an owner's cached notes, e.g. after adding a note whose ID only the backend knows
+        """
+        self._bump(key)
+        self._drop(key)
+
+    def _bump(self, key: OwnerKey):
+        self._versions[key] = self.version(key) + 1
+
+    def _drop(self, key: OwnerKey):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry.size
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': self._size
+        }
@@ -1,38 +1,34 @@
 from dataclass.note import Note
 from datetime import datetime
-from typing import Any, Dict, TYPE_CHECKING
+from asyncio import gather
+from typing import Any, Dict, Iterable, List, Tuple, TYPE_CHECKING
 from urllib.parse import urlparse
 from uuid6 import uuid7
 from .enums import NoteType, SpotifyEntityType
-from .string_util import check_spotify_url, check_url, parse_spotify_url, reconstruct_url
+from .exceptions import SpotifyInvalidURLError
+from .string_util import classify_url, SPOTIFY_NOTE_TYPES
 if TYPE_CHECKING:
-    from clients.spotify_client import Spotify
-    from spotipy import Spotify as SpotifyClient
+    from clients.async_spotify import AsyncSpotify
 
 
-def create_spotify_note(client: 'SpotifyClient', uri: str, from_user: int, to_user: int) -> Note:
-    # Get entity type and ID
-    entity_type, entity_id = parse_spotify_url(uri)
+async def create_spotify_note(spotify: 'AsyncSpotify', uri: str, from_user: int, to_user: int) -> Note:
+    note_type, entity_id, url = classify_url(uri)
+    if note_type not in SPOTIFY_NOTE_TYPES.values():
+        raise SpotifyInvalidURLError(uri)
+    return await _create_spotify_note(spotify, note_type, entity_id, url, from_user, to_user)
 
-    # Build note title and type
-    note_title = uri
-    note_type = None
-    if entity_type == SpotifyEntityType.ALBUM.value:
-        data = client.album(entity_id)
+
+async def _create_spotify_note(spotify: 'AsyncSpotify', note_type: NoteType, entity_id: str, url: str,
+                               from_user: int, to_user: int) -> Note:
+    # Get entity type
+    entity_type = note_type.value.split(':')[1]
+    data = await spotify.resolve(entity_type, entity_id)
+
+    # Build note title
+    if entity_type in [SpotifyEntityType.ALBUM.value, SpotifyEntityType.TRACK.value]:
         note_title = f'{data["artists"][0]["name"]} - {data["name"]}'
-        note_type = NoteType.SPOTIFY_ALBUM
-    elif entity_type == SpotifyEntityType.ARTIST.value:
-        data = client.artist(entity_id)
-        note_title = data["name"]
-        note_type = NoteType.SPOTIFY_ARTIST
-    elif entity_type == SpotifyEntityType.PLAYLIST.value:
-        data = client.playlist(entity_id, fields='name')
+    else:
         note_title = data["name"]
-        note_type = NoteType.SPOTIFY_PLAYLIST
-    elif entity_type == SpotifyEntityType.TRACK.value:
-        data = client.track(entity_id)
-        note_title = f'{data["artists"][0]["name"]} - {data["name"]}'
-        note_type = NoteType.SPOTIFY_TRACK
 
     # Create recommendation
     return Note(
@@ -42,38 +38,92 @@ def create_spotify_note(client: 'SpotifyClient', uri: str, from_user: int, to_us
         recipient=to_user,
         type=note_type,
         title=note_title,
-        url=reconstruct_url(note_type=note_type.value, note_id=entity_id)
+        url=url
     )
 
 
-def create_note(spotify: 'Spotify', content: str, from_user: int, to_user: int) -> Note:
-    # Is it a URL?
-    if check_url(content):
-        # Is it a Spotify URL?
-        if check_spotify_url(content):
-            return create_spotify_note(spotify.client, content, from_user, to_user)
-        else:
-            # Generic URL
-            parsed_url = urlparse(content)
-            return Note(
+async def create_note(spotify: 'AsyncSpotify', content: str, from_user: int, to_user: int) -> Note:
+    note_type, entity_id, url = classify_url(content)
+
+    # Is it a Spotify URL?
+    if note_type in SPOTIFY_NOTE_TYPES.values():
+        return await _create_spotify_note(spotify, note_type, entity_id, url, from_user, to_user)
+    return _create_plain_note(content, note_type, entity_id, url, from_user, to_user)
+
+
+def _create_plain_note(content: str, note_type: NoteType, entity_id: str, url: str, from_user: int, to_user: int) -> Note:
+    # Build note title
+    if note_type == NoteType.YOUTUBE:
+        note_title = f'YouTube video {entity_id}'
+    elif note_type == NoteType.URL:
+        note_title = f'Bookmark at {urlparse(url if "://" in url else f"//{url}").netloc}'
+    else:
+        note_title = f'"{content}"'
+
+    return Note(
+        id=str(uuid7()),
+        timestamp=datetime.now(),
+        sender=from_user,
+        recipient=to_user,
+        type=note_type,
+        title=note_title,
+        url=url
+    )
+
+
+async def create_notes(spotify: 'AsyncSpotify', contents: Iterable[str],
+                       from_user: int, to_user: int) -> Tuple[List[Note], List[str]]:
+    """
+    Create notes for many entries at once.
+    All Spotify metadata is looked up concurrently, so it's fetched in batches through the multi-ID endpoints.
+
+    :return: created notes, in the same order as the entries, and entries that could not be added
+    """
+    classified = [(content, *classify_url(content)) for content in contents]
+
+    # Look up each distinct Spotify entity once
+    entities = list(dict.fromkeys(
+        (note_type, entity_id) for _, note_type, entity_id, _ in classified if note_type in SPOTIFY_NOTE_TYPES.values()
+    ))
+    results = await gather(*[
+        _create_spotify_note(spotify, note_type, entity_id, '', from_user, to_user) for note_type, entity_id in entities
+    ], return_exceptions=True)
+    resolved = dict(zip(entities, results))
+
+    notes = []
+    failed = []
+    for content, note_type, entity_id, url in classified:
+        if (note_type, entity_id) in resolved:
+            result = resolved[(note_type, entity_id)]
+            if isinstance(result, Exception):
+                failed.append(content)
+                continue
+            notes.append(Note(
                 id=str(uuid7()),
                 timestamp=datetime.now(),
                 sender=from_user,
                 recipient=to_user,
-                type=NoteType.URL,
-                title=f'Bookmark at {parsed_url.netloc}',
-                url=content
-            )
+                type=note_type,
+                title=result.title,
+                url=url
+            ))
+        else:
+            notes.append(_create_plain_note(content, note_type, entity_id, url, from_user, to_user))
+    return notes, failed
+
 
-    # Not a URL, add as text
+def create_track_note(name: str, artist: str, track_id: str, from_user: int, to_user: int) -> Note:
+    """
+    Create a note for a Spotify track whose metadata is already known, e.g. from an album or playlist
+    """
     return Note(
         id=str(uuid7()),
         timestamp=datetime.now(),
         sender=from_user,
         recipient=to_user,
-        type=NoteType.TEXT,
-        title=f'"{content}"',
-        url=''
+        type=NoteType.SPOTIFY_TRACK,
+        title=f'{artist} - {name}',
+        url=f'https://open.spotify.com/track/{track_id}'
     )
 
 
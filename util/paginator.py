@@ -1,76 +1,213 @@
-from asyncio import sleep
+from asyncio import AbstractEventLoop, create_task, get_running_loop, Task, TimerHandle
+from collections import OrderedDict
+from heapq import heapify, heappop, heappush
+from itertools import count
 from nextcord import Embed, Interaction, Message
-from typing import Callable, List, Optional
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 from views.paginator_controls import PaginatorControlsView
 
 
+class ExpiryScheduler:
+    """
+    Removes paginator controls once a paginator has been idle for its timeout.
+    Deadlines for all paginators are kept in one heap, and only a single event loop timer is armed,
+    for the earliest deadline, so idle paginators cost nothing until they expire.
+    """
+    def __init__(self):
+        self._heap: List[Tuple[float, int, 'Paginator']] = []
+        self._live = 0
+        self._seq = count()
+        self._timer: Optional[TimerHandle] = None
+        self._timer_deadline = 0.0
+
+    def schedule(self, paginator: 'Paginator', timeout: float):
+        """
+        Set or push back a paginator's deadline
+        """
+        loop = get_running_loop()
+        deadline = loop.time() + timeout
+        if paginator.deadline is None:
+            self._live += 1
+        paginator.deadline = deadline
+        heappush(self._heap, (deadline, next(self._seq), paginator))
+
+        # Drop superseded entries once they outnumber live ones
+        if len(self._heap) > 2 * self._live + 64:
+            self._heap = [entry for entry in self._heap if entry[0] == entry[2].deadline]
+            heapify(self._heap)
+
+        self._arm(loop)
+
+    def _arm(self, loop: AbstractEventLoop):
+        if not self._heap:
+            return
+        earliest = self._heap[0][0]
+        if self._timer is not None:
+            if self._timer_deadline <= earliest:
+                # Already armed early enough
+                return
+            self._timer.cancel()
+        self._timer = loop.call_at(earliest, self._fire, loop)
+        self._timer_deadline = earliest
+
+    def _fire(self, loop: AbstractEventLoop):
+        self._timer = None
+        now = loop.time()
+        while self._heap and self._heap[0][0] <= now:
+            deadline, _, paginator = heappop(self._heap)
+            if paginator.deadline == deadline:
+                # Not pushed back since this entry was added
+                paginator.deadline = None
+                self._live -= 1
+                loop.create_task(paginator.expire())
+        self._arm(loop)
+
+
+expiry_scheduler = ExpiryScheduler()
+
+
 class Paginator:
-    def __init__(self, itx: Interaction):
+    def __init__(self, itx: Interaction, cache_size: int = 8, prefetch: int = 1):
         self.current = 0
-        self.embeds = []
         self.home = 0
         self.itx = itx
+        self.deadline: Optional[float] = None
         self.msg: Optional[Message] = None
-        self.original_timeout = 0
+        self.page_count = 0
         self.timeout = 0
-    
+
+        # Rendered pages, most recently used last
+        self._cache_size = cache_size
+        self._pages: OrderedDict[int, Embed] = OrderedDict()
+        self._prefetch = prefetch
+        self._pending: Dict[int, Task] = {}
+        self._render: Optional[Callable[[int], Awaitable[Embed]]] = None
+
     async def run(self, embeds: List[Embed], start: int = 0, timeout: int = 0, callback: Callable[[int], None] = None):
+        async def render(page: int) -> Embed:
+            return embeds[page]
+        await self.run_lazy(len(embeds), render, start=start, timeout=timeout, callback=callback)
+
+    async def run_lazy(
+            self,
+            page_count: int,
+            render: Callable[[int], Awaitable[Embed]],
+            start: int = 0,
+            timeout: int = 0,
+            callback: Callable[[int], None] = None
+    ):
+        """
+        Paginate pages that are only rendered when they're about to be shown.
+        Only a few pages are kept in memory at a time.
+        Returns once the first page is sent; controls are removed after `timeout` seconds without a page switch.
+        """
+        self.page_count = page_count
+        self._render = render
+
         # If there's only one page, just send it as is
-        if len(embeds) == 1:
-            await self.itx.followup.send(embed=embeds[0])
+        if page_count == 1:
+            msg = await self.itx.followup.send(embed=await render(0))
             if callback is not None:
                 callback(msg.id)
             return
 
         # Based on https://github.com/toxicrecker/DiscordUtils/blob/master/DiscordUtils/Pagination.py
         # but with support for custom home page and adapted for Interaction responses
-        timeout = timeout if timeout > 0 else 60
-        self.original_timeout = timeout
-        self.timeout = timeout
-
-        # Add footer and timestamp to every embed
-        for i in range(len(embeds)):
-            embeds[i].timestamp = self.itx.created_at
-            embeds[i].set_footer(text=f'Page {i + 1} of {len(embeds)}')
+        self.timeout = timeout if timeout > 0 else 60
 
         # Send initial embed and call callback with message ID
         self.home = start
         self.current = start
-        self.embeds = embeds
-        msg = await self.itx.followup.send(embed=self.embeds[start], view=PaginatorControlsView(self))
+        embed = await self._get_page(start)
+        msg = await self.itx.followup.send(embed=embed, view=PaginatorControlsView(self))
         self.msg: Message = await msg.channel.fetch_message(msg.id)
         if callback is not None:
             callback(msg.id)
-        
+        self._prefetch_around(start)
+
         # Remove controls if inactive for more than timeout amount
-        while True:
-            await sleep(1)
-            self.timeout -= 1
-            if self.timeout <= 0:
-                return await self.msg.edit(view=None)
+        expiry_scheduler.schedule(self, self.timeout)
+
+    async def expire(self):
+        """
+        Remove paginator controls and stop rendering pages in the background
+        """
+        for task in list(self._pending.values()):
+            task.cancel()
+        if self.msg is not None:
+            try:
+                await self.msg.edit(view=None)
+            except:
+                pass
+
+    async def _get_page(self, page: int) -> Embed:
+        """
+        Get a rendered page, rendering it if it's not in the cache
+        """
+        if page in self._pages:
+            self._pages.move_to_end(page)
+            return self._pages[page]
+
+        if page not in self._pending:
+            self._pending[page] = create_task(self._render_page(page))
+        return await self._pending[page]
+
+    async def _render_page(self, page: int) -> Embed:
+        try:
+            embed = await self._render(page)
+        finally:
+            self._pending.pop(page, None)
+
+        # Add footer and timestamp
+        embed.timestamp = self.itx.created_at
+        embed.set_footer(text=f'Page {page + 1} of {self.page_count}')
+
+        self._pages[page] = embed
+        while len(self._pages) > self._cache_size:
+            self._pages.popitem(last=False)
+        return embed
+
+    def _prefetch_around(self, page: int):
+        """
+        Render the next and previous pages in the background, so switching to them is instant
+        """
+        for offset in range(1, self._prefetch + 1):
+            for neighbor in ((page + offset) % self.page_count, (page - offset) % self.page_count):
+                if neighbor not in self._pages and neighbor not in self._pending:
+                    task = create_task(self._render_page(neighbor))
+                    task.add_done_callback(self._prefetch_done)
+                    self._pending[neighbor] = task
+
+    @staticmethod
+    def _prefetch_done(task: Task):
+        # Nobody may ever wait for a prefetched page, so retrieve the error here.
+        # The failed render is already out of _pending, so opening the page tries again.
+        if not task.cancelled():
+            task.exception()
 
     async def _switch_page(self, new_page: int) -> Optional[Message]:
-        self.current = new_page
+        self.current = new_page % self.page_count
         if self.msg is not None:
             try:
-                msg = await self.msg.edit(embed=self.embeds[self.current])
+                msg = await self.msg.edit(embed=await self._get_page(self.current))
             except:
                 return None
             else:
-                self.timeout = self.original_timeout
+                expiry_scheduler.schedule(self, self.timeout)
+                self._prefetch_around(self.current)
                 return msg
-    
+
     async def first_page(self):
         await self._switch_page(0)
-    
+
     async def previous_page(self):
         await self._switch_page(self.current - 1)
-    
+
     async def home_page(self):
         await self._switch_page(self.home)
-    
+
     async def next_page(self):
         await self._switch_page(self.current + 1)
-    
+
     async def last_page(self):
-        await self._switch_page(len(self.embeds) - 1)
+        await self._switch_page(self.page_count - 1)
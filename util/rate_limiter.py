@@ -0,0 +1,81 @@
+from asyncio import sleep
+from time import monotonic
+from typing import Dict, Optional, Tuple
+
+
+class TokenBucket:
+    """
+    Token bucket allowing `calls` calls per `period` seconds, with bursts of up to `calls` calls
+    """
+    def __init__(self, calls: int, period: float):
+        self.capacity = calls
+        self.fill_rate = calls / period
+        self.tokens = float(calls)
+        self.updated = monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """
+        Number of seconds until a token becomes available
+        """
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.fill_rate)
+        return wait
+
+    def consume(self):
+        self.tokens -= 1
+
+    def block(self, seconds: float):
+        """
+        Hold off all calls for the given number of seconds, e.g. after a 429 response
+        """
+        self.blocked_until = max(self.blocked_until, monotonic() + seconds)
+        self.tokens = 0
+
+
+class RateLimiter:
+    """
+    Non-blocking rate limiter with a global bucket and one bucket per guild.
+    A call proceeds only once both the global bucket and its guild's bucket have a token.
+    """
+    def __init__(self, global_rate: Tuple[int, float] = (50, 1), guild_rate: Tuple[int, float] = (15, 5)):
+        self._global = TokenBucket(*global_rate)
+        self._guild_rate = guild_rate
+        self._guilds: Dict[int, TokenBucket] = {}
+
+    def _guild_bucket(self, guild_id: int) -> TokenBucket:
+        if guild_id not in self._guilds:
+            self._guilds[guild_id] = TokenBucket(*self._guild_rate)
+        return self._guilds[guild_id]
+
+    async def acquire(self, guild_id: Optional[int] = None):
+        """
+        Wait without blocking the event loop until a call is allowed
+        """
+        while True:
+            now = monotonic()
+            buckets = [self._global]
+            if guild_id is not None:
+                buckets.append(self._guild_bucket(guild_id))
+
+            wait = max(bucket.delay(now) for bucket in buckets)
+            if wait <= 0:
+                for bucket in buckets:
+                    bucket.consume()
+                return
+            await sleep(wait)
+
+    def penalize(self, retry_after: float, guild_id: Optional[int] = None, is_global: bool = False):
+        """
+        Honour a 429 response by holding off calls for `retry_after` seconds
+        """
+        if is_global or guild_id is None:
+            self._global.block(retry_after)
+        else:
+            self._guild_bucket(guild_id).block(retry_after)
@@ -0,0 +1,58 @@
+from random import uniform
+from time import monotonic
+from typing import Optional
+
+
+def jittered_backoff(attempt: int, base_delay: float, max_delay: float) -> float:
+    """
+    Seconds to wait before retry number `attempt` (starting from 0), with exponential backoff and full jitter
+    so that callers that failed together don't all retry together
+    """
+    return uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a failing service for a while, so callers fail fast instead of piling up on timeouts.
+
+    Opens after `failure_threshold` consecutive failures. Once `reset_timeout` seconds have passed,
+    one trial call is let through every `reset_timeout` seconds; the first success closes the breaker again.
+    """
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self) -> bool:
+        """
+        Check whether a call may go through
+        """
+        state = self.state
+        if state == 'half_open':
+            # Let this call through as the trial, and hold off everyone else until the next one
+            self.opened_at = monotonic()
+            return True
+        return state == 'closed'
+
+    def record_success(self):
+        if self.opened_at is not None:
+            print(f'[{self.name}] Circuit closed')
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                print(f'[{self.name}] Circuit opened after {self.failures} consecutive failures')
+            self.opened_at = monotonic()
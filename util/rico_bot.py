@@ -1,26 +1,53 @@
+from aiohttp import web
+from clients.async_spotify import AsyncSpotify
+from clients.spotify_cache import SpotifyMetadataCache
 from clients.spotify_client import Spotify
 from dataclass.custom_embed import create_error_embed
 from nextcord import Interaction
 from nextcord.ext import ipc
 from nextcord.ext.commands import Bot
-from yaml import safe_load
+from time import perf_counter
+from typing import Dict, Optional
 from .api import APIClient
+from .config import Config, get_config, install_reload_handler, watch_config
+from .loop_watchdog import LoopWatchdog
+from .metrics import cache_stats_collector, metrics, start_metrics_server
+from .write_behind import UpsertQueue
 
 
 class RicoBot(Bot):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         
-        # Load config
-        with open('config.yml') as f:
-            try:
-                self.config = safe_load(f)
-            except Exception as e:
-                raise ValueError(f'Error parsing config.yml: {e}')
-        
+        self._started = False
+
+        # Metrics
+        metrics_config = self.config['bot'].get('metrics', {})
+        metrics.enabled = metrics_config.get('enabled', True)
+        self._metrics_server: Optional[web.AppRunner] = None
+        self._command_starts: Dict[int, float] = {}
+
+        # Event loop stall watchdog, off unless enabled
+        watchdog_config = self.config['bot'].get('watchdog', {})
+        self._watchdog: Optional[LoopWatchdog] = None
+        if watchdog_config.get('enabled', False):
+            self._watchdog = LoopWatchdog(
+                threshold=watchdog_config.get('threshold', 0.25),
+                interval=watchdog_config.get('interval', 0.05)
+            )
+        self.application_command_before_invoke(self._before_command)
+
         # Create API client
         self._api = APIClient(self.config)
 
+        # Create write-behind queue for guild and user records
+        write_behind_config = self.config['backend'].get('write_behind', {})
+        self._upserts = UpsertQueue(
+            self._api,
+            flush_interval=write_behind_config.get('flush_interval', 5),
+            batch_size=write_behind_config.get('batch_size', 50)
+        )
+
         # Create Spotify client
         try:
             spotify_client_id = self.config['bot']['spotify']['client_id']
@@ -28,7 +55,25 @@ class RicoBot(Bot):
         except KeyError:
             raise ValueError('Missing Spotify client ID or secret')
         else:
-            self._spotify = Spotify(spotify_client_id, spotify_client_secret)
+            cache_config = self.config['bot']['spotify'].get('cache', {})
+            cache = SpotifyMetadataCache(
+                max_size=cache_config.get('max_size', 2048),
+                ttl=cache_config.get('ttl', 86400),
+                sqlite_path=cache_config.get('sqlite_path'),
+                redis_url=cache_config.get('redis_url')
+            )
+            self._spotify = AsyncSpotify(
+                Spotify(spotify_client_id, spotify_client_secret, cache=cache),
+                max_workers=self.config['bot']['spotify'].get('max_workers', 8),
+                timeout=self.config['bot']['spotify'].get('timeout', 10),
+                page_concurrency=self.config['bot']['spotify'].get('page_concurrency', 4),
+                max_retries=self.config['bot']['spotify'].get('max_retries', 3)
+            )
+
+        metrics.register_collector(cache_stats_collector(lambda: {
+            **{f'backend_{name}': stats for name, stats in self._api.cache_stats.items()},
+            'spotify_metadata': self._spotify.sync.cache.stats
+        }))
 
         # Start IPC server
         self._ipc = ipc.server.Server(
@@ -39,8 +84,39 @@ class RicoBot(Bot):
             do_multicast=False
         )
 
+    async def close(self):
+        # Flush pending writes and close API connection pool before disconnecting
+        await self._upserts.close()
+        await self._api.close()
+        await self._spotify.close()
+        if self._metrics_server is not None:
+            await self._metrics_server.cleanup()
+        if self._watchdog is not None:
+            self._watchdog.stop()
+        await super().close()
+
     async def on_ready(self):
         print('Logged in as {0}!'.format(self.user))
+
+        if not self._started:
+            self._started = True
+
+            # Reload config on SIGHUP, and optionally whenever the file changes
+            install_reload_handler(self.loop)
+            watch_interval = self.config['bot'].get('config_reload_interval', 0)
+            if watch_interval > 0:
+                self.loop.create_task(watch_config(watch_interval))
+
+            if self._watchdog is not None:
+                self._watchdog.start(self.loop)
+
+            # Serve metrics for Prometheus, if enabled
+            metrics_config = self.config['bot'].get('metrics', {})
+            if metrics.enabled and metrics_config.get('port') is not None:
+                self._metrics_server = await start_metrics_server(
+                    metrics_config.get('host', '127.0.0.1'),
+                    metrics_config['port']
+                )
         
         # Add cogs
         self.load_extension('cogs')
@@ -48,7 +124,27 @@ class RicoBot(Bot):
     async def on_ipc_ready(self):
         print('IPC ready!')
 
+    async def _before_command(self, itx: Interaction):
+        self._command_starts[itx.id] = perf_counter()
+
+    def _observe_command(self, itx: Interaction, outcome: str):
+        """
+        Record how long a command took. Also drops its start time, so failed commands don't leak entries.
+        """
+        start = self._command_starts.pop(itx.id, None)
+        if start is not None and itx.application_command is not None:
+            metrics.observe('command_duration_seconds', perf_counter() - start,
+                            command=itx.application_command.name, outcome=outcome)
+
+    async def on_application_command_completion(self, itx: Interaction):
+        # Not an after-invoke hook: nextcord runs those for failed commands too, before the error event
+        self._observe_command(itx, 'ok')
+
     async def on_application_command_error(self, itx: Interaction, error: Exception):
+        self._observe_command(itx, 'error')
+        if itx.application_command is not None:
+            metrics.inc('command_errors_total', command=itx.application_command.name)
+
         error_embed = create_error_embed(
             title='Error processing command',
             body=str(error)
@@ -68,17 +164,22 @@ class RicoBot(Bot):
     def ipc(self) -> ipc.server.Server:
         return self._ipc
 
+    @property
+    def config(self) -> Config:
+        return get_config()
+
     @property
     def debug(self) -> bool:
-        try:
-            return self.config['bot']['debug']['enabled']
-        except KeyError:
-            return False
+        return self.config.debug
     
     @property
     def api(self) -> APIClient:
         return self._api
     
     @property
-    def spotify(self) -> Spotify:
+    def upserts(self) -> UpsertQueue:
+        return self._upserts
+
+    @property
+    def spotify(self) -> AsyncSpotify:
         return self._spotify
@@ -1,11 +1,64 @@
 from math import floor, log, pow
-from typing import Tuple, Union
+from typing import Optional, Tuple, Union
 from urllib.parse import urlparse, parse_qs
+from .enums import NoteType
 from .exceptions import *
 import validators
 import re
 
 
+SPOTIFY_URL_REGEX = re.compile(r"(https?://open\.)*spotify(\.com)*[/:]+(track|artist|album|playlist)[/:]+[A-Za-z0-9]+")
+SPOTIFY_ID_REGEX = re.compile(r"[A-Za-z0-9]{22}")
+YOUTUBE_URL_REGEX = re.compile(r"(?:https?://)?(?:youtu\.be/|(?:www\.|m\.)?youtube\.com/(?:watch|v|embed)(?:\.php)?(?:\?.*v=|/))([a-zA-Z0-9_-]+)")
+
+# Matches Spotify links and URIs, YouTube links, and any other URL or bare domain in a single pass.
+# Only one of the spotify, youtube, and url groups is set for a match.
+NOTE_URL_REGEX = re.compile(r"""
+    (?P<spotify>
+        (?:https?://open\.spotify\.com/(?:intl-[a-z]{2}(?:-[a-z]{2})?/)?|spotify:)
+        (?P<spotify_type>track|artist|album|playlist)[/:](?P<spotify_id>[A-Za-z0-9]+)
+        (?:[/?#]\S*)?
+    )
+    |(?P<youtube>
+        (?:https?://)?
+        (?:youtu\.be/|(?:www\.|m\.)?youtube\.com/(?:watch(?:\.php)?\?(?:\S*?&)?v=|v/|embed/|shorts/))
+        (?P<youtube_id>[A-Za-z0-9_-]+)
+        (?:[?&#/]\S*)?
+    )
+    |(?P<url>
+        [A-Za-z][A-Za-z0-9+.-]*://(?:[^\s/?#@]+@)?
+        (?:(?:[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.)+[A-Za-z]{2,63}|\d{1,3}(?:\.\d{1,3}){3}|\[[0-9A-Fa-f:.]+\])
+        (?::\d{1,5})?(?:[/?#]\S*)?
+        |(?:[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.)+[A-Za-z]{2,63}
+    )
+""", re.VERBOSE)
+SPOTIFY_NOTE_TYPES = {
+    'album': NoteType.SPOTIFY_ALBUM,
+    'artist': NoteType.SPOTIFY_ARTIST,
+    'playlist': NoteType.SPOTIFY_PLAYLIST,
+    'track': NoteType.SPOTIFY_TRACK
+}
+
+
+def classify_url(content: str) -> Tuple[NoteType, Optional[str], str]:
+    """
+    Classify note content in a single pass.
+
+    :return: note type, entity ID (Spotify or YouTube ID, otherwise None), and normalized URL (empty for text)
+    """
+    match = NOTE_URL_REGEX.fullmatch(content)
+    if match is None:
+        return NoteType.TEXT, None, ''
+
+    if match.group('spotify') is not None:
+        entity_type, entity_id = match.group('spotify_type', 'spotify_id')
+        return SPOTIFY_NOTE_TYPES[entity_type], entity_id, f'https://open.spotify.com/{entity_type}/{entity_id}'
+    if match.group('youtube') is not None:
+        video_id = match.group('youtube_id')
+        return NoteType.YOUTUBE, video_id, f'https://www.youtube.com/watch?v={video_id}'
+    return NoteType.URL, None, content
+
+
 def check_ip_addr(url: str) -> bool:
     return validators.ipv4(url) or validators.ipv6(url)
 
@@ -15,13 +68,15 @@ def check_url(url: str) -> bool:
 
 
 def check_spotify_url(url: str) -> bool:
-    url_regex = r"(https?://open\.)*spotify(\.com)*[/:]+(track|artist|album|playlist)[/:]+[A-Za-z0-9]+"
-    return re.match(url_regex, url) is not None
+    return SPOTIFY_URL_REGEX.match(url) is not None
+
+
+def check_spotify_id(entity_id: str) -> bool:
+    return SPOTIFY_ID_REGEX.fullmatch(entity_id) is not None
 
 
 def check_youtube_url(url: str) -> bool:
-    url_regex = r"(?:https?://)?(?:youtu\.be/|(?:www\.|m\.)?youtube\.com/(?:watch|v|embed)(?:\.php)?(?:\?.*v=|/))([a-zA-Z0-9_-]+)"
-    return re.match(url_regex, url) is not None
+    return YOUTUBE_URL_REGEX.match(url) is not None
 
 
 def ellipsis_truncate(string: str, length: int = 200) -> str:
@@ -101,21 +156,10 @@ def min_to_dh(mins: int) -> str:
 
 
 def parse_spotify_url(url: str, valid_types: list[str] = ["track", "album", "artist", "playlist"]) -> tuple[str, str]:
-    if not check_spotify_url(url):
+    match = NOTE_URL_REGEX.fullmatch(url)
+    if match is None or match.group('spotify') is None or match.group('spotify_type') not in valid_types:
         raise SpotifyInvalidURLError(url)
-
-    parsed_path = []
-    if re.match(r"^https?://open\.spotify\.com", url):
-        # We are dealing with a link
-        parsed_url = urlparse(url)
-        parsed_path = parsed_url.path.split("/")[1:]
-    elif re.match(r"^spotify:[a-z]", url):
-        # We are dealing with a Spotify URI
-        parsed_path = url.split(":")[1:]
-    if len(parsed_path) < 2 or parsed_path[0] not in valid_types:
-        raise SpotifyInvalidURLError(url)
-
-    return parsed_path[0], parsed_path[1]
+    return match.group('spotify_type', 'spotify_id')
 
 
 def reconstruct_url(note_type: str, note_id: str) -> str:
@@ -123,6 +167,6 @@ def reconstruct_url(note_type: str, note_id: str) -> str:
         # Spotify url
         split = note_type.split(':')
         return 'https://open.spotify.com/{0}/{1}'.format(split[1], note_id)
-    elif note_type == "youtube-video":
+    elif note_type == NoteType.YOUTUBE.value:
         return 'https://www.youtube.com/watch?v={}'.format(note_id)
     return note_id
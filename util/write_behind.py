@@ -0,0 +1,106 @@
+from asyncio import create_task, Event, gather, Task, TimeoutError, wait_for
+from itertools import islice
+from typing import Dict, Optional, Tuple, TYPE_CHECKING
+if TYPE_CHECKING:
+    from .api import APIClient
+
+
+RecordKey = Tuple[str, int]
+RecordState = Tuple[str, ...]
+
+
+class UpsertQueue:
+    """
+    Write-behind queue for guild and user records.
+
+    Upserts are deduplicated per record and skipped entirely if nothing changed since the last known state.
+    Records not yet written this session are written immediately, since notes and thread settings reference them;
+    changes to known records are flushed in the background in batches.
+    """
+    def __init__(self, api: 'APIClient', flush_interval: float = 5, batch_size: int = 50):
+        self._api = api
+        self._flush_interval = flush_interval
+        self._batch_size = batch_size
+        self._known: Dict[RecordKey, RecordState] = {}
+        self._pending: Dict[RecordKey, RecordState] = {}
+        self._in_flight: Dict[RecordKey, Task] = {}
+        self._wakeup = Event()
+        self._closing = False
+        self._task: Optional[Task] = None
+
+    async def upsert_guild(self, guild_id: int, name: str):
+        await self._upsert(('guild', guild_id), (name,))
+
+    async def upsert_user(self, user_id: int, username: str, discriminator: str):
+        await self._upsert(('user', user_id), (username, discriminator))
+
+    async def _upsert(self, key: RecordKey, state: RecordState):
+        if self._known.get(key) == state:
+            # Nothing changed, drop any stale pending write
+            self._pending.pop(key, None)
+            return
+
+        if key not in self._known:
+            # Record may not exist yet, so write it before the caller depends on it
+            if key not in self._in_flight:
+                self._in_flight[key] = create_task(self._write(key, state))
+            try:
+                await self._in_flight[key]
+            finally:
+                self._in_flight.pop(key, None)
+            return
+
+        # Defer the write
+        self._pending[key] = state
+        if self._task is None or self._task.done():
+            self._task = create_task(self._run())
+        if len(self._pending) >= self._batch_size:
+            self._wakeup.set()
+
+    async def _write(self, key: RecordKey, state: RecordState):
+        kind, record_id = key
+        if kind == 'guild':
+            await self._api.update_guild(record_id, *state)
+        else:
+            await self._api.update_user(record_id, *state)
+        self._known[key] = state
+
+    async def flush(self):
+        """
+        Write all pending upserts to the backend
+        """
+        while self._pending:
+            batch = dict(islice(self._pending.items(), self._batch_size))
+            for key in batch:
+                del self._pending[key]
+
+            results = await gather(*[self._write(key, state) for key, state in batch.items()], return_exceptions=True)
+            for (key, state), result in zip(batch.items(), results):
+                if isinstance(result, Exception):
+                    print(f'Error writing {key[0]} {key[1]}: {result}')
+                    if key not in self._pending:
+                        # Retry on the next flush
+                        self._pending[key] = state
+            if any(isinstance(result, Exception) for result in results):
+                break
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await wait_for(self._wakeup.wait(), timeout=self._flush_interval)
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def close(self):
+        """
+        Stop the background flusher and write out anything still pending.
+        A flush already in progress is allowed to finish, so its batch isn't lost.
+        """
+        self._closing = True
+        if self._task is not None:
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()